@@ -0,0 +1,301 @@
+"""
+Battle_Store
+~~~~~~~~~~~~
+
+Local history of battles, kept in SQLite (battles.db).
+
+The API only returns a player's last ~25 battles (choice 2). Every time we
+fetch them, ``battle_store.ingest(tag, battles)`` adds the ones we haven't
+seen yet, so the history keeps growing past what the API remembers, and
+pages of it are read back from indexes with ``battle_store.page(tag, ...)``.
+
+Battles are deduplicated by battle time + the tags of everyone in them,
+so a battle between two players we track is only stored once, no matter
+whose battle log it came from. ``battle_players`` lists every participant
+of every stored battle (both teammates of a 2v2 too), and a player's
+history is paged and counted from there.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from Data_Models import Battle, normalise_tag, to_json
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS battles (
+    battle_key      TEXT PRIMARY KEY,
+    battle_time     TEXT NOT NULL,
+    team_tag        TEXT NOT NULL,
+    opponent_tag    TEXT,
+    type            TEXT,
+    game_mode       TEXT,
+    team_crowns     INTEGER,
+    opponent_crowns INTEGER,
+    team_cards      TEXT,
+    opponent_cards  TEXT,
+    payload         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_battles_time
+    ON battles (battle_time);
+
+-- One row per participant; side 0 is the stored battle's team, 1 its
+-- opponent. Replaces the old team_tag / opponent_tag indexes, which
+-- only knew the first player on each side
+CREATE TABLE IF NOT EXISTS battle_players (
+    battle_key  TEXT NOT NULL,
+    player_tag  TEXT NOT NULL,
+    side        INTEGER NOT NULL,
+    battle_time TEXT NOT NULL,
+    PRIMARY KEY (player_tag, battle_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_battle_players_time
+    ON battle_players (player_tag, battle_time DESC);
+DROP INDEX IF EXISTS idx_battles_team;
+DROP INDEX IF EXISTS idx_battles_opponent;
+
+CREATE TABLE IF NOT EXISTS ingest_state (
+    player_tag       TEXT PRIMARY KEY,
+    last_battle_time TEXT NOT NULL
+);
+"""
+
+
+def battle_key(battle: Battle) -> str:
+    """Battle time + every participant's tag: the same battle, the same key."""
+    tags = sorted(
+        normalise_tag(p.tag) for p in battle.team + battle.opponent if p.tag
+    )
+    return f"{battle.battle_time}|{','.join(tags)}"
+
+
+def _card_ids(players) -> str:
+    return ",".join(str(card.id) for p in players for card in p.cards)
+
+
+def _crowns(players) -> Optional[int]:
+    return players[0].crowns if players else None
+
+
+def _tag(players) -> Optional[str]:
+    return normalise_tag(players[0].tag) if players and players[0].tag else None
+
+
+def _participants(key: str, battle: Battle, player_tag: str) -> List[tuple]:
+    """``battle_players`` rows for everyone in `battle`."""
+    rows = {}
+    for side, players in ((1, battle.opponent), (0, battle.team)):
+        for p in players:
+            if p.tag:
+                rows[normalise_tag(p.tag)] = side
+    if not battle.team or not battle.team[0].tag:
+        # Stored with `player_tag` as the team (see ingest())
+        rows[player_tag] = 0
+    return [(key, tag, side, battle.battle_time) for tag, side in rows.items()]
+
+
+class BattleStore:
+    """
+    SQLite-backed battle history.
+
+    Parameters
+    ----------
+    path : str
+        Database file; created (with its indexes) on first use.
+    """
+
+    def __init__(self, path: str = "battles.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """A short-lived connection; commits if the block succeeds."""
+        con = sqlite3.connect(self.path, timeout=10)
+        try:
+            if not self._ready:
+                with self._lock:
+                    con.execute("PRAGMA journal_mode=WAL")
+                    con.executescript(_SCHEMA)
+                    self._backfill_players(con)
+                    self._ready = True
+            yield con
+            con.commit()
+        finally:
+            con.close()
+
+    @staticmethod
+    def _backfill_players(con: sqlite3.Connection) -> None:
+        """Fill ``battle_players`` for battles stored before it existed."""
+        if con.execute("SELECT 1 FROM battle_players LIMIT 1").fetchone():
+            return
+        cursor = con.execute("SELECT battle_key, team_tag, payload FROM battles")
+        while True:
+            rows = cursor.fetchmany(500)
+            if not rows:
+                break
+            con.executemany(
+                "INSERT OR IGNORE INTO battle_players VALUES (?, ?, ?, ?)",
+                [
+                    row
+                    for key, team_tag, payload in rows
+                    for row in _participants(
+                        key, Battle.from_dict(json.loads(payload)), team_tag
+                    )
+                ],
+            )
+        con.commit()
+
+    def ingest(self, player_tag: str, battles: List[Battle]) -> int:
+        """
+        Store the battles from `player_tag`'s battle log we haven't seen yet.
+
+        Only battles newer than the last one ingested for this player are
+        looked at (the log is newest-first and overlaps the last fetch), and
+        anything already stored from another player's log is skipped.
+
+        Returns the number of battles actually added.
+        """
+        player_tag = normalise_tag(player_tag)
+        with self.connection() as con:
+            row = con.execute(
+                "SELECT last_battle_time FROM ingest_state WHERE player_tag = ?",
+                (player_tag,),
+            ).fetchone()
+            last_seen = row[0] if row else ""
+
+            new = [
+                b for b in battles if b.battle_time and b.battle_time > last_seen
+            ]
+            if not new:
+                return 0
+
+            added = 0
+            for b in new:
+                key = battle_key(b)
+                cursor = con.execute(
+                    "INSERT OR IGNORE INTO battles"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        key,
+                        b.battle_time,
+                        _tag(b.team) or player_tag,
+                        _tag(b.opponent),
+                        b.type,
+                        b.game_mode.name if b.game_mode else None,
+                        _crowns(b.team),
+                        _crowns(b.opponent),
+                        _card_ids(b.team),
+                        _card_ids(b.opponent),
+                        json.dumps(to_json(b), separators=(",", ":")),
+                    ),
+                )
+                if cursor.rowcount:
+                    added += 1
+                    con.executemany(
+                        "INSERT OR IGNORE INTO battle_players VALUES (?, ?, ?, ?)",
+                        _participants(key, b, player_tag),
+                    )
+
+            con.execute(
+                "INSERT OR REPLACE INTO ingest_state VALUES (?, ?)",
+                (player_tag, max(b.battle_time for b in new)),
+            )
+        return added
+
+    def page(
+        self, player_tag: str, limit: int = 25, offset: int = 0
+    ) -> List[Battle]:
+        """
+        Newest-first page of `player_tag`'s stored battles.
+
+        Battles that were stored from the opponent's log are flipped round,
+        so ``battle.team`` is always `player_tag`'s side.
+        """
+        return list(self.iter_battles(player_tag, limit, offset))
+
+    def iter_battles(
+        self,
+        player_tag: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        batch_size: int = 200,
+    ) -> Iterator[Battle]:
+        """
+        Like ``page()``, but yields the battles one by one, reading
+        `batch_size` rows at a time, so a player's whole history (``limit``
+        None) can be streamed out without loading it all at once.
+        """
+        player_tag = normalise_tag(player_tag)
+        with self.connection() as con:
+            cursor = con.execute(
+                """
+                SELECT b.payload, p.side
+                FROM battle_players p JOIN battles b USING (battle_key)
+                WHERE p.player_tag = ?
+                ORDER BY p.battle_time DESC
+                LIMIT ? OFFSET ?
+                """,
+                (player_tag, -1 if limit is None else limit, offset),
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for payload, side in rows:
+                    battle = Battle.from_dict(json.loads(payload))
+                    if side:
+                        battle.team, battle.opponent = battle.opponent, battle.team
+                    yield battle
+
+    def card_columns(self, player_tag: Optional[str] = None) -> List[tuple]:
+        """
+        (team_cards, opponent_cards, team_crowns, opponent_crowns) per battle.
+
+        Just the columns the analytics need, without decoding any payloads.
+        With `player_tag`, only that player's battles, always from their side.
+        """
+        with self.connection() as con:
+            if player_tag is None:
+                return con.execute(
+                    "SELECT team_cards, opponent_cards, team_crowns, opponent_crowns"
+                    " FROM battles"
+                ).fetchall()
+            player_tag = normalise_tag(player_tag)
+            return con.execute(
+                """
+                SELECT
+                    CASE p.side WHEN 0 THEN team_cards ELSE opponent_cards END,
+                    CASE p.side WHEN 0 THEN opponent_cards ELSE team_cards END,
+                    CASE p.side WHEN 0 THEN team_crowns ELSE opponent_crowns END,
+                    CASE p.side WHEN 0 THEN opponent_crowns ELSE team_crowns END
+                FROM battle_players p JOIN battles b USING (battle_key)
+                WHERE p.player_tag = ?
+                """,
+                (player_tag,),
+            ).fetchall()
+
+    def version(self) -> int:
+        """Changes whenever a battle is added (the newest battle's rowid)."""
+        with self.connection() as con:
+            return con.execute(
+                "SELECT COALESCE(MAX(rowid), 0) FROM battles"
+            ).fetchone()[0]
+
+    def count(self, player_tag: str) -> int:
+        """How many battles are stored for `player_tag`."""
+        player_tag = normalise_tag(player_tag)
+        with self.connection() as con:
+            return con.execute(
+                "SELECT COUNT(*) FROM battle_players WHERE player_tag = ?",
+                (player_tag,),
+            ).fetchone()[0]
+
+
+battle_store = BattleStore(os.getenv("CR_BATTLE_DB", "battles.db"))
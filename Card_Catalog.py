@@ -0,0 +1,126 @@
+"""
+Card_Catalog
+~~~~~~~~~~~~
+
+A local copy of every card in the game (choice 4), saved to disk and
+indexed by card id and by name.
+
+The background refresher in ``Data_Searcher`` keeps it up to date, and
+because it's saved as JSON the card list is available straight after a
+restart without asking the API. Player pages join their cards against it
+with ``card_catalog.join(card)`` (one dict lookup per card) to fill in
+rarity, elixir cost, max level and icon when the player's copy of a card
+is missing them.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from dataclasses import replace
+from typing import Dict, Iterable, List, Optional
+
+from Data_Models import Card, to_json
+
+# Fields the catalog is trusted for when joining a player's card
+_CATALOG_FIELDS = (
+    "rarity",
+    "elixir_cost",
+    "max_level",
+    "max_evolution_level",
+    "icon_url",
+)
+
+
+class CardCatalog:
+    """
+    Every card in the game, indexed by id and name, persisted to `path`.
+
+    Parameters
+    ----------
+    path : str
+        JSON file the catalog is loaded from and saved to.
+    """
+
+    def __init__(self, path: str = "card_catalog.json"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, Card] = {}
+        self._by_name: Dict[str, Card] = {}
+        # Goes up on every update, so anything built from the catalog can
+        # tell it's out of date
+        self.version = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                raw = json.load(f)
+            cards = [Card(**card) for card in raw]
+        except (OSError, ValueError, TypeError):
+            # No catalog yet, a broken one, or one saved with fields Card
+            # no longer has: start empty, the refresher fills it again
+            return
+        self._index(cards)
+
+    def _index(self, cards: Iterable[Card]) -> None:
+        by_id = {}
+        by_name = {}
+        for card in cards:
+            if card.id is None:
+                continue
+            # The catalog describes cards, not anyone's copy of them
+            card = replace(card, level=None, count=None)
+            by_id[card.id] = card
+            if card.name:
+                by_name[card.name.lower()] = card
+        # Swap both indexes in at once so readers never see half an update
+        self._by_id, self._by_name = by_id, by_name
+        self.version += 1
+
+    def update(self, cards: List[Card]) -> None:
+        """Replace the catalog with `cards` (the result of choice 4) and save it."""
+        if not cards:
+            return
+        with self._lock:
+            self._index(cards)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf8") as f:
+                json.dump(to_json(self.cards()), f)
+            os.replace(tmp_path, self.path)
+
+    def get(self, card_id: Optional[int]) -> Optional[Card]:
+        """Look a card up by its id."""
+        return self._by_id.get(card_id)
+
+    def by_name(self, name: str) -> Optional[Card]:
+        """Look a card up by its name (case-insensitive)."""
+        return self._by_name.get(name.lower())
+
+    def cards(self) -> List[Card]:
+        """Every card, in id order."""
+        return [self._by_id[card_id] for card_id in sorted(self._by_id)]
+
+    def join(self, card: Card) -> Card:
+        """
+        Fill in whatever `card` is missing (rarity, elixir, ...) from the catalog.
+
+        The card passed in is never modified (it may be shared through the
+        cache); a filled-in copy is returned when something was missing.
+        """
+        known = self._by_id.get(card.id)
+        if known is None:
+            return card
+        missing = {
+            name: getattr(known, name)
+            for name in _CATALOG_FIELDS
+            if getattr(card, name) is None and getattr(known, name) is not None
+        }
+        return replace(card, **missing) if missing else card
+
+
+card_catalog = CardCatalog(os.getenv("CR_CARD_CATALOG", "card_catalog.json"))
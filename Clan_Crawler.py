@@ -0,0 +1,348 @@
+"""
+Clan_Crawler
+~~~~~~~~~~~~
+
+Crawl whole clans: the clan itself, every member's profile and every
+member's battle log, written to disk as they arrive.
+
+    python Clan_Crawler.py "#CLANTAG" --out crawl --top-clans 20
+
+The crawl is a small pipeline on the ``Data_Searcher`` background loop:
+
+    clans -> [clan task] -> member queue -> [N workers] -> write queue -> [writer]
+
+Both queues are bounded, so when the writer or the API falls behind the
+stages before it wait instead of piling results up in memory. Every
+request goes through ``limited_lookup()`` (shared rate limiter, backoff
+on 429), and the writer appends one JSON line per clan / player /
+battle log to ``clans.ndjson``, ``players.ndjson`` and
+``battles.ndjson`` in the output directory.
+
+``checkpoint.json`` records which clans and players are done (after
+their lines have been flushed), so an interrupted crawl started again
+with the same output directory picks up where it stopped. A player
+whose lines were written just before the interruption may be written a
+second time; nothing is lost. A clan or player whose lookup failed
+(an outage, 429s past every retry) stays pending and is tried again on
+the next run.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Iterable, List, Optional, TextIO
+
+from Data_Models import normalise_tag, to_json
+from Data_Searcher import (
+    ApiKey,
+    TokenBucket,
+    background_loop,
+    initialize,
+    key_pool,
+    limited_lookup,
+    run_sync,
+)
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = "checkpoint.json"
+OUTPUT_FILES = ("clans", "players", "battles")
+
+# Marks the end of a queue
+_DONE = object()
+
+
+class ClanCrawler:
+    """
+    Streams clans, their members' profiles and battle logs to NDJSON files.
+
+    Parameters
+    ----------
+    api_key : str or KeyPool
+        Clash Royale API token, or a pool of them to spread requests over.
+    out_dir : str
+        Directory for the NDJSON files and the checkpoint; created if needed.
+    workers : int
+        How many member lookups run at the same time.
+    queue_size : int
+        Maximum number of members (and of results) waiting between stages.
+    battles : bool
+        Also fetch every member's battle log (choice 2).
+    checkpoint_every : int
+        Save the checkpoint after this many players (and after every clan).
+    bucket : TokenBucket, optional
+        Rate limiter; defaults to the process-wide ``rate_limiter`` (or
+        the pool's bucket).
+    """
+
+    def __init__(
+        self,
+        api_key: ApiKey,
+        out_dir: str = "crawl",
+        workers: int = 8,
+        queue_size: int = 100,
+        battles: bool = True,
+        checkpoint_every: int = 50,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self.api_key = api_key
+        self.out_dir = out_dir
+        self.workers = max(1, workers)
+        self.queue_size = max(1, queue_size)
+        self.battles = battles
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.bucket = bucket
+
+        self.checkpoint_path = os.path.join(out_dir, CHECKPOINT_FILE)
+        self.done_clans: set = set()
+        self.done_players: set = set()
+        self.pending_clans: List[str] = []
+        # player tag -> clan tag, for members whose lookups failed
+        self.pending_players: Dict[str, str] = {}
+        self.stats = {"clans": 0, "players": 0, "battles": 0, "errors": 0}
+        self._load_checkpoint()
+
+    # ------------------------------------------------------------------ #
+    # Checkpoint
+    # ------------------------------------------------------------------ #
+    def _load_checkpoint(self) -> None:
+        try:
+            with open(self.checkpoint_path, "r", encoding="utf8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return  # Fresh crawl
+        self.done_clans = set(state.get("done_clans", ()))
+        self.done_players = set(state.get("done_players", ()))
+        self.pending_clans = list(state.get("pending_clans", ()))
+        self.pending_players = dict(state.get("pending_players", {}))
+
+    def _save_checkpoint(self) -> None:
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf8") as f:
+            json.dump(
+                {
+                    "done_clans": sorted(self.done_clans),
+                    "done_players": sorted(self.done_players),
+                    "pending_clans": self.pending_clans,
+                    "pending_players": self.pending_players,
+                },
+                f,
+            )
+        os.replace(tmp_path, self.checkpoint_path)
+
+    # ------------------------------------------------------------------ #
+    # Pipeline
+    # ------------------------------------------------------------------ #
+    async def run(
+        self, clan_tags: Iterable[str] = (), top_clans: int = 0
+    ) -> Dict[str, int]:
+        """
+        Crawl `clan_tags`, plus the `top_clans` best clans from choice 6.
+
+        Clans and players still pending in the checkpoint are crawled
+        first. Returns how many clans, players and battle logs were
+        written this run, and how many lookups failed.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+
+        seeds = [normalise_tag(tag) for tag in clan_tags if tag.strip()]
+        if top_clans > 0:
+            ranking = await initialize(self.api_key, "", 6, limit=top_clans)
+            if isinstance(ranking, str):
+                log.warning("Top clans unavailable: %s", ranking)
+            else:
+                seeds.extend(normalise_tag(c.tag) for c in ranking if c.tag)
+        for tag in seeds:
+            if tag not in self.done_clans and tag not in self.pending_clans:
+                self.pending_clans.append(tag)
+
+        members: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        writer = asyncio.create_task(self._write(results))
+        workers = [
+            asyncio.create_task(self._member_worker(members, results))
+            for _ in range(self.workers)
+        ]
+
+        async def feed() -> None:
+            await self._crawl_clans(members, results)
+            for _ in workers:
+                await members.put(_DONE)
+            await asyncio.gather(*workers)
+            await results.put(_DONE)
+
+        tasks = [asyncio.create_task(feed()), writer] + workers
+        try:
+            # If any stage fails (e.g. the writer can't write), stop at
+            # once instead of waiting on a queue nobody empties any more
+            done, _ = await asyncio.wait(
+                tasks, return_when=asyncio.FIRST_EXCEPTION
+            )
+            for task in done:
+                task.result()  # Re-raises the failure
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._save_checkpoint()
+        return dict(self.stats)
+
+    async def _lookup(self, tag: str, choice: int) -> Any:
+        return await limited_lookup(self.api_key, tag, choice, self.bucket)
+
+    async def _crawl_clans(
+        self, members: asyncio.Queue, results: asyncio.Queue
+    ) -> None:
+        """Producer: fetch each pending clan and queue up its members."""
+        queued = set()  # Members shared between clans are only fetched once
+        for tag, clan_tag in list(self.pending_players.items()):
+            if tag not in self.done_players:
+                queued.add(tag)
+                # Not counted towards its clan (which may well be done)
+                await members.put((tag, clan_tag, False))
+        for clan_tag in list(self.pending_clans):
+            clan = await self._lookup(clan_tag, 3)
+            if isinstance(clan, str):
+                # Stays pending, so the next run tries it again
+                await results.put(("clans", {"tag": clan_tag, "error": clan}))
+                continue
+            await results.put(("clans", to_json(clan)))
+            tags = [normalise_tag(m.tag) for m in clan.member_list or () if m.tag]
+            todo = [
+                tag for tag in dict.fromkeys(tags)
+                if tag not in self.done_players and tag not in queued
+            ]
+            queued.update(todo)
+            # The clan only counts as done once all of these are
+            await results.put(("clan_members", (clan_tag, len(todo))))
+            for tag in todo:
+                # Waits here while the workers are behind
+                await members.put((tag, clan_tag, True))
+
+    async def _member_worker(
+        self, members: asyncio.Queue, results: asyncio.Queue
+    ) -> None:
+        """Consumer: fetch one member's profile (and battle log) at a time."""
+        while True:
+            item = await members.get()
+            if item is _DONE:
+                return
+            tag, clan_tag, counted = item
+            profile = await self._lookup(tag, 1)
+            failed = isinstance(profile, str)
+            if failed:
+                await results.put(("players", {"tag": tag, "error": profile}))
+            else:
+                await results.put(("players", to_json(profile)))
+            if self.battles:
+                battles = await self._lookup(tag, 2)
+                if isinstance(battles, str):
+                    failed = True
+                    line = {"tag": tag, "error": battles}
+                else:
+                    line = {"tag": tag, "clan_tag": clan_tag, "battles": to_json(battles)}
+                await results.put(("battles", line))
+            await results.put(("player_done", (tag, clan_tag, counted, not failed)))
+
+    async def _write(self, results: asyncio.Queue) -> None:
+        """
+        Single writer: append each result as one JSON line, then mark the
+        clan / player done (a player only if every lookup worked, otherwise
+        it's kept pending) and checkpoint every so often.
+        """
+        files: Dict[str, TextIO] = {
+            name: open(
+                os.path.join(self.out_dir, name + ".ndjson"), "a", encoding="utf8"
+            )
+            for name in OUTPUT_FILES
+        }
+        outstanding: Dict[str, int] = {}
+        since_checkpoint = 0
+        try:
+            while True:
+                item = await results.get()
+                if item is _DONE:
+                    return
+                kind, payload = item
+                if kind in ("clan_members", "player_done"):
+                    if kind == "clan_members":
+                        clan_tag, count = payload
+                        outstanding[clan_tag] = count
+                    else:
+                        tag, clan_tag, counted, ok = payload
+                        if ok:
+                            self.done_players.add(tag)
+                            self.pending_players.pop(tag, None)
+                        else:
+                            self.pending_players[tag] = clan_tag
+                        since_checkpoint += 1
+                        if counted:
+                            outstanding[clan_tag] -= 1
+                    if outstanding.get(clan_tag) == 0:
+                        del outstanding[clan_tag]
+                        self.done_clans.add(clan_tag)
+                        self.pending_clans.remove(clan_tag)
+                        since_checkpoint = self.checkpoint_every
+                else:
+                    files[kind].write(
+                        json.dumps(payload, separators=(",", ":")) + "\n"
+                    )
+                    self.stats["errors" if "error" in payload else kind] += 1
+                    continue
+
+                if since_checkpoint >= self.checkpoint_every:
+                    # Everything written so far must be on disk before the
+                    # checkpoint says it's done
+                    for f in files.values():
+                        f.flush()
+                    self._save_checkpoint()
+                    since_checkpoint = 0
+        finally:
+            for f in files.values():
+                f.close()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Crawl clans, their members and their battle logs to NDJSON."
+    )
+    parser.add_argument("clan_tags", nargs="*", help="clan tags to start from")
+    parser.add_argument("--out", default="crawl", help="output directory")
+    parser.add_argument(
+        "--top-clans", type=int, default=0, help="also crawl the N best clans"
+    )
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument(
+        "--no-battles", action="store_true", help="skip members' battle logs"
+    )
+    args = parser.parse_args(argv)
+
+    if not key_pool:
+        parser.error("set CR_API_KEY (or several keys in CR_API_KEYS).")
+    # One key is used as it is; several are rotated
+    api_key = key_pool if len(key_pool) > 1 else key_pool.keys[0].token
+    if not args.clan_tags and args.top_clans <= 0:
+        parser.error("give at least one clan tag or --top-clans.")
+
+    logging.basicConfig(level=logging.INFO)
+    crawler = ClanCrawler(
+        api_key,
+        out_dir=args.out,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        battles=not args.no_battles,
+    )
+    try:
+        stats = run_sync(crawler.run(args.clan_tags, args.top_clans))
+    finally:
+        background_loop.stop()
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Data_Models
+~~~~~~~~~~~
+
+Slim, typed versions of the API data the pages actually show.
+
+The wrapper hands back python-box attribute-dicts that copy the whole API
+response (every key, recursively converted to snake_case). They're slow
+to build and heavy to keep in a cache, so ``Data_Searcher`` converts every
+result into these small ``__slots__`` dataclasses straight from the raw
+JSON, keeping only the fields the templates and routes use.
+
+    Player, Card, Badge, Arena, GameMode, Battle, BattleParticipant,
+    Clan, ClanMember
+
+Use ``to_json()`` to turn any of them (or lists of them) back into plain
+dicts, e.g. for ``jsonify``, and ``normalise_tag()`` to compare tags.
+"""
+
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field, is_dataclass
+from typing import Any, Collection, Dict, List, Optional
+
+# Optional parts of a player profile that can be left out with `fields`
+PLAYER_SECTIONS = (
+    "arena",
+    "clan",
+    "cards",
+    "current_deck",
+    "badges",
+    "league_statistics",
+)
+
+
+@dataclass(slots=True)
+class Arena:
+    id: Optional[int] = None
+    name: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: Optional[Dict[str, Any]]) -> Optional["Arena"]:
+        if not data:
+            return None
+        return cls(id=data.get("id"), name=data.get("name"))
+
+
+@dataclass(slots=True)
+class GameMode:
+    id: Optional[int] = None
+    name: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: Optional[Dict[str, Any]]) -> Optional["GameMode"]:
+        if not data:
+            return None
+        return cls(id=data.get("id"), name=data.get("name"))
+
+
+@dataclass(slots=True)
+class Card:
+    """A card, either from the game's card list or from a player's collection."""
+
+    id: Optional[int] = None
+    name: Optional[str] = None
+    rarity: Optional[str] = None
+    elixir_cost: Optional[int] = None
+    max_level: Optional[int] = None
+    max_evolution_level: Optional[int] = None
+    icon_url: Optional[str] = None
+    # Only set for cards a player owns
+    level: Optional[int] = None
+    count: Optional[int] = None
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Card":
+        return cls(
+            id=data.get("id"),
+            name=data.get("name"),
+            rarity=data.get("rarity"),
+            elixir_cost=data.get("elixirCost"),
+            max_level=data.get("maxLevel"),
+            max_evolution_level=data.get("maxEvolutionLevel"),
+            icon_url=(data.get("iconUrls") or {}).get("medium"),
+            level=data.get("level"),
+            count=data.get("count"),
+        )
+
+
+@dataclass(slots=True)
+class Badge:
+    name: Optional[str] = None
+    level: Optional[int] = None
+    max_level: Optional[int] = None
+    progress: Optional[int] = None
+    target: Optional[int] = None
+    icon_url: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Badge":
+        return cls(
+            name=data.get("name"),
+            level=data.get("level"),
+            max_level=data.get("maxLevel"),
+            progress=data.get("progress"),
+            target=data.get("target"),
+            icon_url=(data.get("iconUrls") or {}).get("large"),
+        )
+
+
+@dataclass(slots=True)
+class ClanMember:
+    tag: Optional[str] = None
+    name: Optional[str] = None
+    role: Optional[str] = None
+    trophies: Optional[int] = None
+    exp_level: Optional[int] = None
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "ClanMember":
+        return cls(
+            tag=data.get("tag"),
+            name=data.get("name"),
+            role=data.get("role"),
+            trophies=data.get("trophies"),
+            exp_level=data.get("expLevel"),
+        )
+
+
+@dataclass(slots=True)
+class Clan:
+    """A full clan (choice 3), a leaderboard entry (choice 6) or a player's clan."""
+
+    tag: Optional[str] = None
+    name: Optional[str] = None
+    clan_score: Optional[int] = None
+    badge_id: Optional[int] = None
+    members: Optional[int] = None
+    location: Optional[str] = None
+    # Only set for leaderboard entries
+    rank: Optional[int] = None
+    previous_rank: Optional[int] = None
+    # Only set for full clans
+    member_list: Optional[List[ClanMember]] = None
+
+    @classmethod
+    def from_json(cls, data: Optional[Dict[str, Any]]) -> Optional["Clan"]:
+        if not data:
+            return None
+        members = data.get("memberList")
+        return cls(
+            tag=data.get("tag"),
+            name=data.get("name"),
+            clan_score=data.get("clanScore"),
+            badge_id=data.get("badgeId"),
+            members=data.get("members"),
+            location=(data.get("location") or {}).get("name"),
+            rank=data.get("rank"),
+            previous_rank=data.get("previousRank"),
+            member_list=(
+                [ClanMember.from_json(m) for m in members]
+                if members is not None
+                else None
+            ),
+        )
+
+
+@dataclass(slots=True)
+class Player:
+    """A full player profile (choice 1) or a leaderboard entry (choice 5)."""
+
+    tag: Optional[str] = None
+    name: Optional[str] = None
+    trophies: Optional[int] = None
+    exp_level: Optional[int] = None
+    arena: Optional[Arena] = None
+    clan: Optional[Clan] = None
+    cards: Optional[List[Card]] = None
+    current_deck: Optional[List[Card]] = None
+    badges: Optional[List[Badge]] = None
+    league_statistics: Optional[Dict[str, Any]] = None
+    # Only set for leaderboard entries
+    rank: Optional[int] = None
+
+    @classmethod
+    def from_json(
+        cls, data: Dict[str, Any], fields: Optional[Collection[str]] = None
+    ) -> "Player":
+        """
+        Build a player from the API JSON.
+
+        `fields` limits which of ``PLAYER_SECTIONS`` are converted; the
+        rest are left as None. The small scalar fields (tag, name,
+        trophies, ...) are always kept. None means every section.
+        """
+
+        def wanted(section: str) -> bool:
+            return fields is None or section in fields
+
+        cards = data.get("cards") if wanted("cards") else None
+        deck = data.get("currentDeck") if wanted("current_deck") else None
+        badges = data.get("badges") if wanted("badges") else None
+        return cls(
+            tag=data.get("tag"),
+            name=data.get("name"),
+            trophies=data.get("trophies"),
+            exp_level=data.get("expLevel"),
+            arena=Arena.from_json(data.get("arena")) if wanted("arena") else None,
+            clan=Clan.from_json(data.get("clan")) if wanted("clan") else None,
+            cards=[Card.from_json(c) for c in cards] if cards is not None else None,
+            current_deck=(
+                [Card.from_json(c) for c in deck] if deck is not None else None
+            ),
+            badges=(
+                [Badge.from_json(b) for b in badges] if badges is not None else None
+            ),
+            league_statistics=(
+                data.get("leagueStatistics") if wanted("league_statistics") else None
+            ),
+            rank=data.get("rank"),
+        )
+
+
+@dataclass(slots=True)
+class BattleParticipant:
+    """One side's player in a battle."""
+
+    tag: Optional[str] = None
+    name: Optional[str] = None
+    crowns: Optional[int] = None
+    cards: List[Card] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "BattleParticipant":
+        return cls(
+            tag=data.get("tag"),
+            name=data.get("name"),
+            crowns=data.get("crowns"),
+            cards=[Card.from_json(c) for c in data.get("cards") or ()],
+        )
+
+
+@dataclass(slots=True)
+class Battle:
+    type: Optional[str] = None
+    battle_time: Optional[str] = None
+    arena: Optional[Arena] = None
+    game_mode: Optional[GameMode] = None
+    team: List[BattleParticipant] = field(default_factory=list)
+    opponent: List[BattleParticipant] = field(default_factory=list)
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "Battle":
+        return cls(
+            type=data.get("type"),
+            battle_time=data.get("battleTime"),
+            arena=Arena.from_json(data.get("arena")),
+            game_mode=GameMode.from_json(data.get("gameMode")),
+            team=[BattleParticipant.from_json(p) for p in data.get("team") or ()],
+            opponent=[
+                BattleParticipant.from_json(p) for p in data.get("opponent") or ()
+            ],
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Battle":
+        """Rebuild a battle that was saved with ``to_json()``."""
+
+        def side(players: List[Dict[str, Any]]) -> List[BattleParticipant]:
+            return [
+                BattleParticipant(
+                    tag=p.get("tag"),
+                    name=p.get("name"),
+                    crowns=p.get("crowns"),
+                    cards=[Card(**c) for c in p.get("cards") or ()],
+                )
+                for p in players
+            ]
+
+        arena = data.get("arena")
+        game_mode = data.get("game_mode")
+        return cls(
+            type=data.get("type"),
+            battle_time=data.get("battle_time"),
+            arena=Arena(**arena) if arena else None,
+            game_mode=GameMode(**game_mode) if game_mode else None,
+            team=side(data.get("team") or ()),
+            opponent=side(data.get("opponent") or ()),
+        )
+
+
+def normalise_tag(tag: str) -> str:
+    """One spelling per tag: '#abc', 'ABC' and ' #ABC ' all become '#ABC'."""
+    return "#" + tag.strip().lstrip("#").upper().replace("O", "0")
+
+
+def to_json(data: Any) -> Any:
+    """Turn models (or lists of them) into plain dicts/lists for JSON output."""
+    if isinstance(data, (list, tuple)):
+        return [to_json(item) for item in data]
+    if is_dataclass(data):
+        return asdict(data)
+    return data
@@ -1,8 +1,8 @@
 
 # 1. This is the actual logic for connecting with the Clash API and
 #    getting that data, we import this into the main.py file, you can
-#    see that in 'from Data_Searcher import initialize' this file is
-#    Data_Searcher.py
+#    see that in 'Data_Searcher = lazy_module("Data_Searcher")' and
+#    'Data_Searcher.initialize(...)', this file is Data_Searcher.py
 
 # IMPORTANT NOTE, any flashy code separations and the _extract_items
 # function is done with the help of AI, as a backend developer I still
@@ -14,8 +14,37 @@ Data_Searcher
 
 Async helper for talking to the Clash Royale official API.
 
-Public entrypoint:
+Public entrypoints:
     async initialize(api_key: str, tag: str, choice: int = 1, clan_tag: str = "")
+    async fetch_many(api_key: str, lookups: dict)  -> several choices concurrently
+    async bulk_lookup(api_key: str, tags: list)    -> many tags, rate limited
+    async limited_lookup(api_key: str, tag: str)   -> one tag, rate limited
+    async for entry in iter_leaderboard(api_key, choice=5)  -> every page
+    async for tag, result in iter_bulk_lookup(api_key, tags) -> as they finish
+
+Sync code walks those async iterators with ``iterate_sync()``.
+
+Every real request gets a timeout for its choice (``REQUEST_TIMEOUTS``),
+is retried with jittered backoff (honouring Retry-After) when the API
+is struggling, and goes through a per-choice ``CircuitBreaker`` that
+fails fast while the API keeps failing; lookups then fall back to the
+last copy in memory if there is one.
+
+With CR_MODE=record every answer is also saved for ``Replay_Archive``,
+and with CR_MODE=replay answers come from that archive instead of the
+API, so the app runs without a network.
+
+Anywhere an `api_key` goes, a ``KeyPool`` of several tokens can go
+instead (``key_pool``, from CR_API_KEYS): each request is then sent on
+the least busy key, with a rate limiter per key, and a key the API
+refuses is set aside for a while.
+
+Every lookup goes through one shared, keep-alive connection pool
+(`client_manager`), behind an in-memory TTL/LRU cache (`response_cache`)
+that answers repeated lookups without touching clash_cache.db.
+Synchronous code (the Flask views) runs lookups on a single long-lived
+background loop with `run_sync(initialize(...))`, and calls
+`background_loop.stop()` once when the app stops.
 
 `choice` decides what we fetch:
 
@@ -27,7 +56,8 @@ Public entrypoint:
     6 -> Top clans globally (no tag needed)
 
 Return value:
-    - On success: the object / list returned by the API (often a list of dicts)
+    - On success: slim models from Data_Models (Player, [Battle], Clan,
+      [Card], [Player], [Clan] for choices 1–6)
     - On failure: a human-readable error string
 """
 
@@ -35,11 +65,102 @@ Return value:
 #    the clash royale related code that's being imported
 from __future__ import annotations
 
-from typing import Any, List
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import aiohttp
 from clashroyale.official_api import Client
-from clashroyale.errors import NotFoundError, Unauthorized, RatelimitError
+from clashroyale.official_api.utils import crtag
+from clashroyale.errors import (
+    NetworkError,
+    NotFoundError,
+    NotResponding,
+    RatelimitError,
+    RequestError,
+    ServerError,
+    StatusError,
+    Unauthorized,
+)
+
+import Metrics
+from Card_Catalog import card_catalog
+from Data_Models import Battle, Card, Clan, Player, normalise_tag
+from Replay_Archive import ReplayMissError, recorder
+from Snapshot_Store import snapshot_store
+
+T = TypeVar("T")
+
+# One API token, or a KeyPool of them
+ApiKey = Union[str, "KeyPool"]
+
+log = logging.getLogger(__name__)
+
+# Returned by initialize() when the API answers 429; bulk_lookup() looks
+# for it to know when to back off and try again
+RATE_LIMIT_MESSAGE = "You hit the rate limit. Slow down."
+
+
+# Returned when the API is down (or was, a moment ago) and there's no
+# older copy of the data to show instead
+UNAVAILABLE_MESSAGE = "The Clash Royale API couldn't be reached, try again soon."
+
+# Returned in replay mode for a lookup the archive has no answer to
+NOT_RECORDED_MESSAGE = "Not found: this lookup was never recorded for replay."
+
+
+class CircuitOpenError(RequestError):
+    """Raised instead of calling the API while its circuit breaker is open."""
+
+    def __init__(self):
+        self.code = 503
+        self.error = UNAVAILABLE_MESSAGE
+        super().__init__(self.error)
+
+
+class NoUsableKeyError(RequestError):
+    """Raised instead of calling the API while every key in a pool is set aside."""
+
+    def __init__(self):
+        self.code = 401
+        self.error = "Every API key was refused; check your API tokens."
+        super().__init__(self.error)
+
+
+# What a failed API call can raise: the wrapper's errors, and aiohttp's
+# for anything that fails before a request is even sent
+API_ERRORS = (RequestError, aiohttp.ClientError)
+
+
+def api_error_message(exc: Exception) -> str:
+    """The same short messages initialize() returns, for a raised API error."""
+    if isinstance(exc, NotFoundError):
+        return "Not found."
+    if isinstance(exc, (Unauthorized, NoUsableKeyError)):
+        return "Check your API token."
+    if isinstance(exc, RatelimitError):
+        return RATE_LIMIT_MESSAGE
+    if isinstance(exc, ReplayMissError):
+        return NOT_RECORDED_MESSAGE
+    return UNAVAILABLE_MESSAGE
 
 
 def _extract_items(result: Any) -> List[Any]:
@@ -77,21 +198,698 @@ def _extract_items(result: Any) -> List[Any]:
     return [raw] if raw is not None else []
 
 
+def _raw_json(obj: Any) -> Any:
+    """The plain API JSON behind one of the wrapper's objects."""
+    return getattr(obj, "raw_data", obj)
+
+
+async def _get_raw(client: Client, url: str, **params: Any) -> Any:
+    """
+    GET `url` through the wrapper's request layer and return the plain JSON.
+
+    This keeps the wrapper's SQLite cache, timeout and error mapping
+    (NotFoundError, RatelimitError, ...) but skips building its box models,
+    which for a player with 100+ cards is most of the conversion time.
+    """
+    data, _cached, _ts, _resp = await client._request(url, **params)
+    return data
+
+
+# Which choice the current task is fetching, for the metrics labels
+_current_choice: contextvars.ContextVar = contextvars.ContextVar(
+    "current_choice", default="none"
+)
+
+
+def _error_label(exc: BaseException) -> str:
+    if isinstance(exc, RatelimitError):
+        return "ratelimit"
+    if isinstance(exc, NotResponding):
+        return "timeout"
+    if isinstance(exc, NotFoundError):
+        return "not_found"
+    if isinstance(exc, Unauthorized):
+        return "unauthorized"
+    if isinstance(exc, ServerError):
+        return "server"
+    if isinstance(exc, (NetworkError, aiohttp.ClientError)):
+        return "network"
+    if isinstance(exc, ReplayMissError):
+        return "not_recorded"
+    return "other"
+
+
+# ---------------------------------------------------------------------- #
+# Timeouts, retries and circuit breakers
+# ---------------------------------------------------------------------- #
+# Seconds one request for each choice may take. A hung API then holds a
+# Flask worker for a few seconds instead of the wrapper's 15
+REQUEST_TIMEOUTS = {
+    1: 5.0,   # player profile
+    2: 5.0,   # player battles
+    3: 5.0,   # clan
+    4: 10.0,  # all cards
+    5: 8.0,   # top players (a page)
+    6: 8.0,   # top clans (a page)
+}
+DEFAULT_TIMEOUT = 10.0
+
+# A failed request (429, timeout, 5xx, network) is retried up to
+# MAX_RETRIES times, but all attempts together may only take RETRY_BUDGET
+# seconds; waits start around RETRY_BASE_DELAY and double each time
+MAX_RETRIES = int(os.getenv("CR_MAX_RETRIES", "2"))
+RETRY_BUDGET = float(os.getenv("CR_RETRY_BUDGET", "8"))
+RETRY_BASE_DELAY = 0.25
+
+# Overrides MAX_RETRIES for the current task: the bulk lookups and the
+# leaderboard pages retry 429s themselves (pausing their shared bucket),
+# so their requests aren't retried a second time underneath
+_max_retries: contextvars.ContextVar = contextvars.ContextVar(
+    "max_retries", default=None
+)
+
+
+def _is_degraded(exc: BaseException) -> bool:
+    """Errors that mean the API is struggling (worth retrying), not a bad request."""
+    if isinstance(exc, (RatelimitError, ServerError, NotResponding, NetworkError)):
+        return True
+    if isinstance(exc, StatusError):
+        return exc.code >= 500
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError))
+
+
+def _retry_delay(exc: BaseException, attempt: int) -> float:
+    """Retry-After when the API sent one, otherwise jittered exponential backoff."""
+    if isinstance(exc, StatusError):
+        retry_after = getattr(exc.response, "headers", {}).get("Retry-After")
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            pass  # Missing, or an HTTP date we don't bother parsing
+    return random.uniform(0.5, 1.5) * RETRY_BASE_DELAY * 2 ** attempt
+
+
+class CircuitBreaker:
+    """
+    Stops calling the API for one choice while it keeps failing.
+
+    After `threshold` degraded failures in a row (timeouts, 5xx, network
+    errors, each after its retries) the breaker opens: for
+    `cooldown` seconds requests fail straight away with
+    ``CircuitOpenError`` instead of tying up a worker, and lookups are
+    answered from older cached data where there is some. Then one request
+    is let through as a test; if it works the breaker closes again,
+    otherwise it stays open for another `cooldown`.
+
+    A 429 doesn't count: the API is up, we're only asking too fast, and
+    Retry-After and the rate limiters already deal with that.
+
+    Parameters
+    ----------
+    name : str
+        Label for the metrics (the choice).
+    threshold : int
+        Failures in a row that open the breaker.
+    cooldown : float
+        Seconds to wait before testing the API again.
+    """
+
+    def __init__(self, name: str, threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, name: str) -> "CircuitBreaker":
+        """Build a breaker from CR_BREAKER_THRESHOLD and CR_BREAKER_COOLDOWN."""
+        return cls(
+            name,
+            threshold=int(os.getenv("CR_BREAKER_THRESHOLD", "5")),
+            cooldown=float(os.getenv("CR_BREAKER_COOLDOWN", "30")),
+        )
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Whether a request may go out now."""
+        if self._opened_at is None:
+            return True
+        now = time.monotonic()
+        if now - self._opened_at < self.cooldown:
+            return False
+        # Let this one through as a test, and keep everyone else out for
+        # another cooldown in case it fails (or never reports back)
+        self._opened_at = now
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        if self._opened_at is not None:
+            self._opened_at = None
+            Metrics.circuit_open.set(0, choice=self.name)
+            log.info("API circuit for choice %s closed again", self.name)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self._opened_at is None:
+                log.warning(
+                    "API circuit for choice %s opened after %d failures",
+                    self.name,
+                    self.failures,
+                )
+            self._opened_at = time.monotonic()
+            Metrics.circuit_open.set(1, choice=self.name)
+
+
+# One breaker per choice: a struggling clan endpoint doesn't stop players
+circuit_breakers = {
+    choice: CircuitBreaker.from_env(str(choice)) for choice in REQUEST_TIMEOUTS
+}
+
+
+class _MeteredClient(Client):
+    """
+    The wrapper's client, with a timeout per choice, retries with backoff
+    and a circuit breaker around every real request to the API, and its
+    SQLite cache hits/misses and requests recorded in ``Metrics``.
+
+    With a `key_pool` every attempt is signed with a key picked from the
+    pool instead of the client's own token. In replay mode (see
+    ``Replay_Archive``) nothing is sent: the recorded answer is returned.
+    """
+
+    key_pool: Optional["KeyPool"] = None
+
+    def _resolve_cache(self, url, **params):
+        cached = super()._resolve_cache(url, **params)
+        Metrics.sqlite_cache.inc(result="miss" if cached is None else "hit")
+        return cached
+
+    async def _arequest(self, url, **params):
+        if recorder.replaying:
+            return self._replay(url, params)
+        choice = _current_choice.get()
+        breaker = circuit_breakers.get(choice)
+        if breaker is not None and not breaker.allow():
+            Metrics.upstream_errors.inc(choice=choice, error="circuit_open")
+            raise CircuitOpenError()
+
+        params.setdefault("timeout", REQUEST_TIMEOUTS.get(choice, DEFAULT_TIMEOUT))
+        max_retries = _max_retries.get()
+        if max_retries is None:
+            max_retries = MAX_RETRIES
+        pool = self.key_pool
+        deadline = time.monotonic() + RETRY_BUDGET
+        attempt = 0
+        while True:
+            key = None if pool is None else pool.choose()
+            try:
+                result = await self._attempt(url, key, choice, params)
+            except Exception as exc:
+                error = _error_label(exc)
+                Metrics.upstream_errors.inc(choice=choice, error=error)
+                if key is not None and isinstance(exc, Unauthorized):
+                    if pool.quarantine(key):
+                        continue  # Same request, on another key, right away
+                if not _is_degraded(exc):
+                    # The API answered, just not with what we wanted
+                    if breaker is not None:
+                        breaker.record_success()
+                    raise
+                delay = _retry_delay(exc, attempt)
+                if key is not None and isinstance(exc, RatelimitError):
+                    # Only this key is over its limit: pause it, and don't
+                    # wait at all if another key still has tokens
+                    key.bucket.penalize(delay)
+                    if pool.ready():
+                        delay = 0.0
+                if attempt >= max_retries or time.monotonic() + delay > deadline:
+                    if breaker is not None and not isinstance(exc, RatelimitError):
+                        breaker.record_failure()
+                    raise
+                Metrics.upstream_retries.inc(choice=choice, reason=error)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    async def _attempt(self, url, key, choice, params):
+        """One request, after waiting for `key`'s rate limiter if there's a key."""
+        if key is not None:
+            # Counts as load while it waits, so other requests pick other keys
+            key.in_flight += 1
+        try:
+            if key is not None:
+                await key.bucket.acquire()
+            with Metrics.upstream_in_flight.track():
+                with Metrics.upstream_seconds.time(choice=choice):
+                    return await self._send(url, key, **params)
+        finally:
+            if key is not None:
+                key.in_flight -= 1
+
+    async def _send(self, url, key, **params):
+        """
+        The wrapper's request, signed with `key` when there is one, and
+        saved to the journal in record mode.
+        """
+        headers = self.headers
+        if key is not None:
+            # The wrapper puts its one token in self.headers, which every
+            # request shares, so each request gets headers of its own
+            headers = dict(headers, Authorization="Bearer " + key.token)
+            Metrics.api_key_requests.inc(key=key.name)
+        timeout = params.pop("timeout", None) or self.timeout
+        try:
+            async with self.session.request(
+                params.get("method", "GET"),
+                url,
+                timeout=timeout,
+                headers=headers,
+                params=params,
+                data=params.get("json", {}),
+            ) as resp:
+                text = await resp.text()
+        except asyncio.TimeoutError:
+            raise NotResponding
+        except aiohttp.ClientError as exc:
+            # Refused or reset connections, DNS failures, disconnects: one
+            # error type for the retries, the breaker and the callers
+            raise NetworkError from exc
+        if recorder.recording:
+            recorder.record(url[len(self.api.BASE) :], params, resp.status, text)
+        return self._raise_for_status(resp, text)
+
+    def _replay(self, url, params):
+        """Answer from the replay archive, exactly as the API once did."""
+        status, text = recorder.replay(url[len(self.api.BASE) :], params)
+        return self._raise_for_status(
+            _ReplayedResponse(url, status), text, method="GET"
+        )
+
+
+class _ReplayedResponse:
+    """As much of an aiohttp response as ``_raise_for_status`` looks at."""
+
+    reason = "Replayed"
+
+    def __init__(self, url: str, status: int):
+        self.url = url
+        self.status = status
+        self.headers: Dict[str, str] = {}
+
+
+class ClientManager:
+    """
+    Process-wide owner of the aiohttp session and the API clients.
+
+    Opening a session per lookup means every request pays for a fresh
+    TCP+TLS handshake and a fresh SQLite cache connection. Instead we keep
+    one keep-alive connection pool and one ``Client`` per API token, and
+    hand those out to every ``initialize()`` call.
+
+    aiohttp sessions belong to the event loop that created them, so if the
+    manager is used from a different loop (e.g. a new ``asyncio.run()``)
+    the pool is rebuilt on that loop.
+
+    Parameters
+    ----------
+    limit : int
+        Total number of simultaneous connections in the pool.
+    limit_per_host : int
+        Simultaneous connections to the API host.
+    keepalive_timeout : float
+        Seconds an idle connection is kept open for reuse.
+    dns_cache_ttl : int
+        Seconds resolved addresses are cached for.
+    api_url : str, optional
+        Base URL of the API; None uses the wrapper's default (the official
+        API). Pointing it somewhere else is how the benchmarks run against
+        a local stand-in.
+    cache_path : str
+        The wrapper's SQLite cache file.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 30,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        api_url: Optional[str] = None,
+        cache_path: str = "clash_cache.db",
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.api_url = api_url
+        self.cache_path = cache_path
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connector: Optional[aiohttp.TCPConnector] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._clients: Dict[str, Client] = {}
+
+    @classmethod
+    def from_env(cls) -> "ClientManager":
+        """
+        Build a manager whose pool limits (CR_POOL_*), API URL (CR_API_URL)
+        and cache file (CR_CACHE_DB) can be set from the environment.
+        """
+        return cls(
+            limit=int(os.getenv("CR_POOL_LIMIT", "100")),
+            limit_per_host=int(os.getenv("CR_POOL_LIMIT_PER_HOST", "30")),
+            keepalive_timeout=float(os.getenv("CR_POOL_KEEPALIVE", "30")),
+            api_url=os.getenv("CR_API_URL") or None,
+            cache_path=os.getenv("CR_CACHE_DB", "clash_cache.db"),
+        )
+
+    def _bind(self, loop: asyncio.AbstractEventLoop) -> None:
+        """(Re)build the connection pool on `loop`."""
+        if self._session is not None and self._loop is not None:
+            if self._loop.is_closed():
+                # The loop that owned the old pool is gone and so are its
+                # sockets; just drop the pool without touching the dead loop.
+                self._session.detach()
+                self._connector._close()
+            else:
+                self._loop.call_soon_threadsafe(
+                    self._loop.create_task, self._session.close()
+                )
+
+        self._loop = loop
+        self._connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self._session = aiohttp.ClientSession(connector=self._connector)
+        self._clients = {}
+
+    async def get_client(self, api_key: ApiKey) -> Client:
+        """
+        Return the shared client for `api_key`, creating it on first use.
+
+        For a ``KeyPool`` that's one client which signs every request with
+        a key from the pool.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._bind(loop)
+
+        client = self._clients.get(api_key)
+        if client is None:
+            options = {"url": self.api_url} if self.api_url else {}
+            pool = api_key if isinstance(api_key, KeyPool) else None
+            client = _MeteredClient(
+                # A pool's client signs each request itself (see _send)
+                token=api_key if pool is None else "",
+                is_async=True,
+                session=self._session,
+                error_debug=False,
+                timeout=15,
+                # Replayed answers don't need caching, and replay mode
+                # shouldn't need clash_cache.db at all
+                cache_fp=None if recorder.replaying else self.cache_path,
+                cache_expires=60,
+                table_name="cr_cache",
+                user_agent="MyClashApp/2.0",
+                camel_case=False,
+                **options,
+            )
+            client.key_pool = pool
+            self._clients[api_key] = client
+        return client
+
+    async def close(self) -> None:
+        """Close the pool. Must be awaited on the loop the pool was built on."""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._connector = None
+        self._clients = {}
+        self._loop = None
+
+
+# One pool for the whole process, shared by every lookup
+client_manager = ClientManager.from_env()
+
+
+async def shutdown() -> None:
+    """Close the shared connection pool (call this when the app stops)."""
+    await client_manager.close()
+
+
+class LoopThread:
+    """
+    One event loop running forever in a daemon thread.
+
+    Flask views are synchronous, so instead of paying for a new loop with
+    ``asyncio.run()`` on every lookup they hand their coroutines to this
+    loop with ``run_sync()``. Because the loop lives as long as the worker,
+    the shared connection pool in ``client_manager`` stays bound to it and
+    connections are actually reused between requests.
+
+    The thread is started lazily on first use, so a pre-forking server
+    (gunicorn) gets one loop per worker rather than one in the master.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running background loop (started on first access)."""
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._start()
+            return self._loop
+
+    def _start(self) -> None:
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def _run() -> None:
+            asyncio.set_event_loop(loop)
+            loop.call_soon(started.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=_run, name="clash-api-loop", daemon=True)
+        thread.start()
+        started.wait()
+
+        self._loop = loop
+        self._thread = thread
+        self._pid = os.getpid()
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run `coro` on the background loop and block until it finishes."""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        return future.result(timeout)
+
+    def stop(self) -> None:
+        """Close the connection pool, then stop and join the loop thread."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or self._pid != os.getpid():
+                return
+            self._loop = None
+            self._thread = None
+
+        asyncio.run_coroutine_threadsafe(_cancel_background_tasks(), loop).result(10)
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(10)
+        loop.close()
+
+
+async def _cancel_background_tasks() -> None:
+    """Cancel long-running tasks (e.g. refreshers) before the loop stops."""
+    current = asyncio.current_task()
+    tasks = [task for task in asyncio.all_tasks() if task is not current]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+# The loop every Flask view submits its lookups to
+background_loop = LoopThread()
+
+
+def run_sync(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Run a Data_Searcher coroutine from synchronous (Flask) code."""
+    return background_loop.run(coro, timeout)
+
+
+async def _anext(iterator: AsyncIterator[T]) -> T:
+    return await iterator.__anext__()
+
+
+def iterate_sync(
+    iterator: AsyncIterator[T], timeout: Optional[float] = None
+) -> Iterator[T]:
+    """
+    Walk an async iterator (e.g. ``iter_leaderboard()``) from synchronous
+    code, one item at a time on the background loop.
+
+    Meant for streaming responses: nothing is collected up front, and if
+    the caller stops early the async iterator is closed (cancelling
+    whatever it was prefetching).
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(_anext(iterator), timeout)
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            run_sync(aclose(), timeout)
+
+
+# ---------------------------------------------------------------------- #
+# In-memory cache
+# ---------------------------------------------------------------------- #
+class TTLCache:
+    """
+    Small thread-safe LRU cache where every entry has its own expiry time.
+
+    Sits in front of the wrapper's SQLite cache (clash_cache.db) so hot
+    tags are answered straight from memory, without disk or network I/O.
+    Once `maxsize` entries are stored the least recently used one is
+    dropped.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of entries kept.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Any:
+        """Return the cached value, or None if it's missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                # Expired entries stay (until pushed out) for get_stale()
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key: Any) -> Any:
+        """
+        Return the cached value even if it has expired (None if it was
+        never stored or has been pushed out), for when nothing fresher
+        can be had.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            return entry[1] if entry is not None else None
+
+    def set(self, key: Any, value: Any, ttl: float) -> None:
+        """Store `value` for `ttl` seconds."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current size."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+# How long (seconds) a successful result of each choice stays in memory:
+# the card list barely ever changes, player profiles change every battle.
+# For choices 4-6 this is how often the background refresher re-fetches.
+CACHE_TTLS = {
+    1: 10,        # player profile
+    2: 30,        # player battles
+    3: 30,        # clan
+    4: 6 * 3600,  # all cards
+    5: 300,       # top players
+    6: 300,       # top clans
+}
+
+response_cache = TTLCache(int(os.getenv("CR_MEMORY_CACHE_SIZE", "1024")))
+
+
+# Lookups currently waiting on the API, keyed like response_cache
+_in_flight: Dict[tuple, asyncio.Task] = {}
+
+
+def _cache_key(
+    choice: int, tag: str, clan_tag: str, limit: int, fields: Optional[tuple] = None
+) -> tuple:
+    if choice == 1:
+        return (choice, normalise_tag(tag), fields)
+    if choice == 3:
+        return (choice, normalise_tag(clan_tag or tag))
+    if choice == 2:
+        return (choice, normalise_tag(tag))
+    if choice in (5, 6):
+        return (choice, limit)
+    return (choice,)
+
+
+def _is_cacheable(result: Any) -> bool:
+    """Only keep real data, never error strings or empty lists."""
+    if isinstance(result, str):
+        return False
+    if isinstance(result, list) and not result:
+        return False
+    return True
+
+
 async def initialize(  # 3. You can see initialize being used in main.py
-    api_key: str,
+    api_key: ApiKey,
     tag: str,
     choice: int = 1,
     clan_tag: str = "",
     battle_limit=None,
     limit: int=10,
+    fields: Optional[Iterable[str]] = None,
 ):
     """
-    Main async entrypoint used by Flask via asyncio.run().
+    Main async entrypoint used by Flask via run_sync().
+
+    Choices 4–6 are served by ``global_refresher`` (stale-while-revalidate),
+    apart from leaderboards longer than ``REFRESH_LIMIT``. For the others, successful results are kept in ``response_cache`` for
+    ``CACHE_TTLS[choice]`` seconds; only misses reach the API (through
+    the process-wide ``client_manager`` connection pool). Identical
+    lookups that arrive while one is already in flight share its result,
+    error strings included.
 
     Parameters
     ----------
-    api_key : str
-        Clash Royale API token.
+    api_key : str or KeyPool
+        Clash Royale API token, or a pool of them to spread requests over.
     tag : str
         For choices 1 & 2: player tag.
         For choice 3 (clan): used as the clan tag if `clan_tag` is not provided.
@@ -101,117 +899,830 @@ async def initialize(  # 3. You can see initialize being used in main.py
     clan_tag : str, optional
         Alternative way to pass the clan tag for choice 3. If this is a
         non-empty string, it takes priority over `tag`.
+    fields : iterable of str, optional
+        Choice 1 only: which optional player sections to keep (any of
+        ``Data_Models.PLAYER_SECTIONS``). Sections not listed are skipped
+        while converting and never stored. None keeps everything.
 
     Returns
     -------
-    - On success: API object / list
+    - On success: Data_Models object / list (see module docstring)
     - On failure: error string
     """
-    async with aiohttp.ClientSession() as session: # 4. Starting the 
-        client = Client(                           #    connection
-            token=api_key,                         #    session
-            is_async=True,
-            session=session,
-            error_debug=False,
-            timeout=15,
-            cache_fp="clash_cache.db",
-            cache_expires=60,
-            table_name="cr_cache",
-            user_agent="MyClashApp/2.0",
-            camel_case=False,
+    with Metrics.lookup_seconds.time(choice=choice):
+        return await _lookup(api_key, tag, choice, clan_tag, limit, fields)
+
+
+async def _lookup(
+    api_key: ApiKey,
+    tag: str,
+    choice: int,
+    clan_tag: str,
+    limit: int,
+    fields: Optional[Iterable[str]],
+):
+    # Cards and leaderboards are the same for everyone: answer from the
+    # copy the background refresher keeps warm. A longer leaderboard
+    # than it keeps is fetched (and cached) like any other lookup
+    if choice in GLOBAL_CHOICES and not (choice in (5, 6) and limit > REFRESH_LIMIT):
+        return await global_refresher.get(api_key, choice, limit)
+
+    if fields is not None:
+        fields = tuple(sorted(set(fields)))
+
+    key = _cache_key(choice, tag, clan_tag, limit, fields)
+    cached = response_cache.get(key)
+    Metrics.memory_cache.inc(
+        choice=choice, result="miss" if cached is None else "hit"
+    )
+    if cached is not None:
+        return cached
+
+    # Single-flight: if the same lookup is already on its way to the API,
+    # wait for that one instead of sending another identical request
+    loop = asyncio.get_running_loop()
+    task = _in_flight.get(key)
+    if task is None or task.get_loop() is not loop:
+        task = loop.create_task(
+            _fetch_and_cache(key, api_key, tag, choice, clan_tag, limit, fields)
         )
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _forget_in_flight(key, done))
 
-        # Decide which clan identifier to use (for choice 3)
-        clan_identifier = clan_tag or tag
+    # shield() so one caller giving up doesn't cancel it for the others
+    return await asyncio.shield(task)
 
-        # ------------------------------------------------------------------ #
-        # Player profile
-        # ------------------------------------------------------------------ #
-        if choice == 1:
-            try:
-                return await client.get_player(tag)
-            except NotFoundError:
-                return "No such player tag."
-            except Unauthorized:
-                return "Check your API token."
-            except RatelimitError:
-                return "You hit the rate limit. Slow down."
-
-        # ------------------------------------------------------------------ #
-        # Player battles
-        # ------------------------------------------------------------------ #
-        if choice == 2:
-            try:
-                return await client.get_player_battles(tag)
-            except NotFoundError:
-                return "No such player tag."
-            except Unauthorized:
-                return "Check your API token."
-            except RatelimitError:
-                return "You hit the rate limit. Slow down."
-
-        # ------------------------------------------------------------------ #
-        # Clan by tag
-        # ------------------------------------------------------------------ #
-        if choice == 3:
-            try:
-                return await client.get_clan(clan_identifier)
-            except NotFoundError:
-                return "No such clan tag."
-            except Unauthorized:
-                return "Check your API token."
-            except RatelimitError:
-                return "You hit the rate limit. Slow down."
-
-        # ------------------------------------------------------------------ #
-        # All cards
-        # ------------------------------------------------------------------ #
-        if choice == 4:
-            try:
-                result = await client.get_all_cards()
-                items = _extract_items(result)
-                # For cards we just return [] if empty (could also turn into error string
-                # if you want similar behaviour to choices 5 & 6)
-                return items
-            except Unauthorized:
-                return "Check your API token."
-            except RatelimitError:
-                return "You hit the rate limit. Slow down."
-
-        # ------------------------------------------------------------------ #
-        # Top players (global)
-        # ------------------------------------------------------------------ #
-        if choice == 5:
-            try:
-                result = await client.get_top_players("global", limit=limit)
-                # We only care about the first page → no async iteration
-                items = _extract_items(result)
-                if not items:
-                    # Turn "empty items" into an error string so Flask can show it
-                    return "API: no top players data returned (items was empty)."
-                return items
-            except Unauthorized:
-                return "Check your API token."
-            except RatelimitError:
-                return "You hit the rate limit. Slow down."
-
-        # ------------------------------------------------------------------ #
-        # Top clans (global)
-        # ------------------------------------------------------------------ #
-        if choice == 6:
+
+async def _fetch_and_cache(
+    key: tuple,
+    api_key: ApiKey,
+    tag: str,
+    choice: int,
+    clan_tag: str,
+    limit: int,
+    fields: Optional[tuple],
+):
+    try:
+        result = await _fetch(api_key, tag, choice, clan_tag, limit, fields)
+    except API_ERRORS as exc:
+        result = api_error_message(exc)
+    if _is_cacheable(result):
+        response_cache.set(key, result, CACHE_TTLS[choice])
+        snapshot_store.record_later(choice, result)
+        return result
+    if result in (RATE_LIMIT_MESSAGE, UNAVAILABLE_MESSAGE):
+        # The API is struggling: an older copy beats an error message
+        stale = response_cache.get_stale(key)
+        if stale is not None:
+            return stale
+    return result
+
+
+def _forget_in_flight(key: tuple, task: asyncio.Task) -> None:
+    if _in_flight.get(key) is task:
+        del _in_flight[key]
+
+
+# ---------------------------------------------------------------------- #
+# Background refresh for data that's the same for every user
+# ---------------------------------------------------------------------- #
+GLOBAL_CHOICES = (4, 5, 6)
+
+# How soon to try again after a failed refresh (seconds)
+REFRESH_RETRY_DELAY = 30
+
+# Leaderboard entries the refresher keeps; every lookup up to that gets a
+# slice of that one copy, so asking for a new `limit` never starts
+# another task (longer ones go through response_cache instead)
+REFRESH_LIMIT = 200
+
+
+class GlobalDataRefresher:
+    """
+    Keeps the card list and the leaderboards (choices 4–6) warm.
+
+    Each choice gets one task on the background loop that re-fetches it
+    (leaderboards at ``REFRESH_LIMIT`` entries) every
+    ``CACHE_TTLS[choice]`` seconds; the card list is also saved to
+    ``card_catalog``, the leaderboards to ``snapshot_store``. Lookups are
+    answered straight away with the last good copy (the first `limit`
+    entries of a leaderboard), so pages never wait for the API; only the
+    very first lookup of a choice waits for its first fetch. If a refresh
+    fails the old copy keeps being served and is marked stale.
+
+    A choice that nobody asked for in `idle_after` seconds stops
+    refreshing and is forgotten.
+    """
+
+    def __init__(self, idle_after: float = 1800):
+        self.idle_after = idle_after
+        self._api_key = ""
+        self._entries: Dict[tuple, Dict[str, Any]] = {}
+        self._tasks: Dict[tuple, asyncio.Task] = {}
+
+    async def get(self, api_key: ApiKey, choice: int, limit: int = 10) -> Any:
+        """
+        Return the last good copy, cut to `limit` entries for a leaderboard
+        (or an error string if there never was one).
+        """
+        self._api_key = api_key
+        key = _cache_key(choice, "", "", REFRESH_LIMIT)
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = {"data": None, "stale": False, "ready": asyncio.Event()}
+            # The saved card catalog can answer straight away, even right
+            # after a restart; the refresh below brings it up to date
+            if choice == 4 and len(card_catalog):
+                entry["data"] = card_catalog.cards()
+                entry["ready"].set()
+            self._entries[key] = entry
+        entry["wanted"] = time.monotonic()
+
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        if task is None or task.done() or task.get_loop() is not loop:
+            self._tasks[key] = loop.create_task(self._keep_fresh(key, choice))
+
+        if not entry["ready"].is_set():
+            await entry["ready"].wait()
+        data = entry["data"]
+        if choice in (5, 6) and isinstance(data, list):
+            return data[: max(0, limit)]
+        return data
+
+    def start(self, api_key: ApiKey) -> None:
+        """Start refreshing the cards and both leaderboards (thread-safe)."""
+        for choice in GLOBAL_CHOICES:
+            asyncio.run_coroutine_threadsafe(
+                self.get(api_key, choice), background_loop.loop
+            )
+
+    def is_stale(self, choice: int) -> bool:
+        """True if the copy being served failed its last refresh."""
+        entry = self._entries.get(_cache_key(choice, "", "", REFRESH_LIMIT))
+        return bool(entry and entry["stale"])
+
+    async def _keep_fresh(self, key: tuple, choice: int) -> None:
+        entry = self._entries[key]
+        loop = asyncio.get_running_loop()
+        try:
+            while time.monotonic() - entry["wanted"] < self.idle_after:
+                try:
+                    result = await _fetch(
+                        self._api_key, "", choice, "", REFRESH_LIMIT
+                    )
+                except ReplayMissError as exc:
+                    # Expected in replay mode, not worth a traceback
+                    log.info("Refreshing choice %s: %s", choice, exc.error)
+                    result = api_error_message(exc)
+                except API_ERRORS as exc:
+                    log.warning("Refreshing choice %s failed: %r", choice, exc)
+                    result = api_error_message(exc)
+                except Exception:
+                    log.exception("Refreshing choice %s failed", choice)
+                    result = UNAVAILABLE_MESSAGE
+
+                if not isinstance(result, str):
+                    entry["data"], entry["stale"] = result, False
+                    if choice == 4:
+                        # Saving it writes a file: keep that off the loop
+                        try:
+                            await loop.run_in_executor(
+                                None, card_catalog.update, result
+                            )
+                        except OSError:
+                            log.exception("Saving the card catalog failed")
+                    else:
+                        snapshot_store.record_later(choice, result)
+                elif entry["data"] is None or isinstance(entry["data"], str):
+                    # Nothing good to fall back on yet, pass the error on
+                    entry["data"] = result
+                else:
+                    entry["stale"] = True
+                entry["ready"].set()
+
+                failed = isinstance(result, str)
+                await asyncio.sleep(
+                    min(REFRESH_RETRY_DELAY, CACHE_TTLS[choice])
+                    if failed
+                    else CACHE_TTLS[choice]
+                )
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+                self._entries.pop(key, None)
+
+
+global_refresher = GlobalDataRefresher()
+
+
+async def _fetch(
+    api_key: ApiKey,
+    tag: str,
+    choice: int,
+    clan_tag: str,
+    limit: int,
+    fields: Optional[tuple] = None,
+):
+    """Fetch one choice from the API, skipping the in-memory cache."""
+    # Label this task's requests in the metrics (every caller runs _fetch
+    # in a task of its own, so this doesn't leak into anyone else's)
+    _current_choice.set(choice)
+    client = await client_manager.get_client(api_key)  # 4. Borrowing the
+                                                       #    shared client
+
+    # Decide which clan identifier to use (for choice 3)
+    clan_identifier = clan_tag or tag
+
+    # ------------------------------------------------------------------ #
+    # Player profile
+    # ------------------------------------------------------------------ #
+    if choice == 1:
+        try:
+            # Skip the wrapper's box models: we only build the sections
+            # that were asked for straight from the JSON
+            url = client.api.PLAYER + "/" + crtag(tag)
+            return Player.from_json(await _get_raw(client, url), fields)
+        except NotFoundError:
+            return "No such player tag."
+        except Unauthorized:
+            return "Check your API token."
+        except RatelimitError:
+            return RATE_LIMIT_MESSAGE
+
+    # ------------------------------------------------------------------ #
+    # Player battles
+    # ------------------------------------------------------------------ #
+    if choice == 2:
+        try:
+            result = await client.get_player_battles(tag)
+            return [Battle.from_json(_raw_json(b)) for b in _extract_items(result)]
+        except NotFoundError:
+            return "No such player tag."
+        except Unauthorized:
+            return "Check your API token."
+        except RatelimitError:
+            return RATE_LIMIT_MESSAGE
+
+    # ------------------------------------------------------------------ #
+    # Clan by tag
+    # ------------------------------------------------------------------ #
+    if choice == 3:
+        try:
+            return Clan.from_json(_raw_json(await client.get_clan(clan_identifier)))
+        except NotFoundError:
+            return "No such clan tag."
+        except Unauthorized:
+            return "Check your API token."
+        except RatelimitError:
+            return RATE_LIMIT_MESSAGE
+
+    # ------------------------------------------------------------------ #
+    # All cards
+    # ------------------------------------------------------------------ #
+    if choice == 4:
+        try:
+            result = await client.get_all_cards()
+            items = _extract_items(result)
+            # For cards we just return [] if empty (could also turn into error string
+            # if you want similar behaviour to choices 5 & 6)
+            return [Card.from_json(_raw_json(card)) for card in items]
+        except Unauthorized:
+            return "Check your API token."
+        except RatelimitError:
+            return RATE_LIMIT_MESSAGE
+
+    # ------------------------------------------------------------------ #
+    # Top players (global)
+    # ------------------------------------------------------------------ #
+    if choice == 5:
+        try:
+            result = await client.get_top_players("global", limit=limit)
+            # One page of `limit` entries; iter_leaderboard() walks them all
+            items = _extract_items(result)
+            if not items:
+                # Turn "empty items" into an error string so Flask can show it
+                return "API: no top players data returned (items was empty)."
+            return [Player.from_json(_raw_json(player)) for player in items]
+        except Unauthorized:
+            return "Check your API token."
+        except RatelimitError:
+            return RATE_LIMIT_MESSAGE
+
+    # ------------------------------------------------------------------ #
+    # Top clans (global)
+    # ------------------------------------------------------------------ #
+    if choice == 6:
+        try:
+            result = await client.get_top_clans(limit=limit)
+            # One page of `limit` entries; iter_leaderboard() walks them all
+            items = _extract_items(result)
+            if not items:
+                return "API: no top clans data returned (items was empty)."
+            return [Clan.from_json(_raw_json(clan)) for clan in items]
+        except Unauthorized:
+            return "Check your API token."
+        except RatelimitError:
+            return RATE_LIMIT_MESSAGE
+
+    # ------------------------------------------------------------------ #
+    # Unknown choice
+    # ------------------------------------------------------------------ #
+    raise ValueError("Choice must be an integer between 1 and 6.")
+
+
+async def fetch_many(api_key: ApiKey, lookups: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Run several ``initialize()`` lookups at the same time.
+
+    A page that needs e.g. the player profile *and* the battle log now
+    waits for the slowest call instead of the sum of all calls.
+
+    Parameters
+    ----------
+    api_key : str or KeyPool
+        Clash Royale API token, or a pool of them to spread requests over.
+    lookups : dict
+        Maps a name of your choosing to the keyword arguments for
+        ``initialize()`` (everything except `api_key`; `tag` may be left
+        out for choices 4–6), e.g.::
+
+            {"player": {"tag": tag, "choice": 1},
+             "battles": {"tag": tag, "choice": 2}}
+
+    Returns
+    -------
+    dict
+        The same names mapped to what ``initialize()`` returned for each:
+        the API data, or an error string if only that lookup failed.
+        Unexpected exceptions are re-raised once every lookup has finished.
+    """
+    names = list(lookups)
+    results = await asyncio.gather(
+        *(initialize(api_key, **{"tag": "", **lookups[name]}) for name in names),
+        return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return dict(zip(names, results))
+
+
+# ---------------------------------------------------------------------- #
+# Bulk lookups
+# ---------------------------------------------------------------------- #
+class TokenBucket:
+    """
+    Async token bucket that spaces out requests to stay under the API's
+    rate limit.
+
+    Every request takes one token; tokens refill at `rate` per second up
+    to `capacity` (the allowed burst). When the API still answers 429,
+    ``penalize()`` empties the bucket and pauses everyone for a while.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second (sustained requests per second).
+    capacity : int
+        Maximum number of tokens that can be saved up (burst size).
+    """
+
+    def __init__(self, rate: float = 10.0, capacity: int = 20):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    @classmethod
+    def from_env(cls) -> "TokenBucket":
+        """Build a bucket from CR_RATE_LIMIT (requests/s) and CR_RATE_BURST."""
+        return cls(
+            rate=float(os.getenv("CR_RATE_LIMIT", "10")),
+            capacity=int(os.getenv("CR_RATE_BURST", "20")),
+        )
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a request is allowed to go out."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # The lock makes waiters queue up in order instead of all waking
+        # at once and fighting over the same token
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def available(self) -> float:
+        """Tokens that could be taken right now (0 while paused)."""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return 0.0
+        self._refill(now)
+        return self._tokens
+
+    def penalize(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds` after the API said 429."""
+        self._tokens = 0.0
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# Shared by every bulk lookup in the process
+rate_limiter = TokenBucket.from_env()
+
+
+async def limited_lookup(
+    api_key: ApiKey,
+    tag: str,
+    choice: int = 1,
+    bucket: Optional[TokenBucket] = None,
+    max_retries: int = 4,
+) -> Any:
+    """
+    ``initialize()`` for one tag, behind the rate limiter.
+
+    Takes a token from `bucket` (default ``rate_limiter``, or the pool's
+    own bucket when `api_key` is a ``KeyPool``) before every
+    attempt and backs off and retries when the API answers 429 (each
+    attempt is one request: the client's own retries are turned off). A
+    malformed tag comes back as an error string instead of raising.
+    """
+    bucket = bucket or _bucket_for(api_key)
+    token = _max_retries.set(0)
+    try:
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
             try:
-                result = await client.get_top_clans(limit=limit)
-                # First page only; avoids buggy async generator path
-                items = _extract_items(result)
-                if not items:
-                    return "API: no top clans data returned (items was empty)."
-                return items
-            except Unauthorized:
-                return "Check your API token."
-            except RatelimitError:
-                return "You hit the rate limit. Slow down."
-
-        # ------------------------------------------------------------------ #
-        # Unknown choice
-        # ------------------------------------------------------------------ #
-        raise ValueError("Choice must be an integer between 1 and 6.")
+                result = await initialize(api_key, tag, choice)
+            except ValueError as exc:
+                # Malformed tag: report it for this tag only
+                return str(exc)
+            if result != RATE_LIMIT_MESSAGE or attempt == max_retries:
+                return result
+            bucket.penalize(2 ** attempt + random.uniform(0, 1))
+    finally:
+        _max_retries.reset(token)
+
+
+async def bulk_lookup(
+    api_key: ApiKey,
+    tags: List[str],
+    choice: int = 1,
+    concurrency: int = 10,
+    bucket: Optional[TokenBucket] = None,
+    max_retries: int = 4,
+) -> Dict[str, Any]:
+    """
+    Look up many player (or clan) tags with bounded concurrency.
+
+    At most `concurrency` lookups are in flight at once and every request
+    first takes a token from `bucket`, so we stay under the API's rate
+    limit. If the API still answers 429 the bucket is paused with an
+    exponential, jittered backoff and the tag is retried, instead of
+    handing "Slow down." back to the caller.
+
+    Parameters
+    ----------
+    api_key : str or KeyPool
+        Clash Royale API token, or a pool of them to spread requests over.
+    tags : list of str
+        Tags to look up. Duplicates are only fetched once.
+    choice : int
+        1 (player profile), 2 (player battles) or 3 (clan).
+    concurrency : int
+        Maximum number of lookups running at the same time.
+    bucket : TokenBucket, optional
+        Rate limiter to use; defaults to the process-wide ``rate_limiter``
+        (or the pool's bucket when `api_key` is a ``KeyPool``).
+    max_retries : int
+        How many times a rate-limited tag is retried before giving up.
+
+    Returns
+    -------
+    dict
+        tag -> API object, or an error string for that tag, in the order
+        the tags were given.
+    """
+    if choice not in (1, 2, 3):
+        raise ValueError("Bulk lookups only support choices 1, 2 and 3.")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(tag: str) -> Any:
+        async with semaphore:
+            return await limited_lookup(api_key, tag, choice, bucket, max_retries)
+
+    unique_tags = list(dict.fromkeys(tags))
+    results = await asyncio.gather(*(_one(tag) for tag in unique_tags))
+    return dict(zip(unique_tags, results))
+
+
+async def iter_bulk_lookup(
+    api_key: ApiKey,
+    tags: List[str],
+    choice: int = 1,
+    concurrency: int = 10,
+    bucket: Optional[TokenBucket] = None,
+    max_retries: int = 4,
+) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    ``bulk_lookup()`` that yields ``(tag, result)`` as each lookup finishes.
+
+    Results come out in completion order, not the order of `tags`, so the
+    first ones can be sent on while the rest are still running. Closing
+    the iterator early cancels the lookups that haven't finished.
+    """
+    if choice not in (1, 2, 3):
+        raise ValueError("Bulk lookups only support choices 1, 2 and 3.")
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(tag: str) -> Tuple[str, Any]:
+        async with semaphore:
+            result = await limited_lookup(api_key, tag, choice, bucket, max_retries)
+        return tag, result
+
+    tasks = [asyncio.ensure_future(_one(tag)) for tag in dict.fromkeys(tags)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+# ---------------------------------------------------------------------- #
+# API key pool
+# ---------------------------------------------------------------------- #
+class PooledKey:
+    """One token in a ``KeyPool``, with its own rate limiter."""
+
+    def __init__(self, name: str, token: str, bucket: TokenBucket):
+        self.name = name  # For logs and metrics; the token itself is secret
+        self.token = token
+        self.bucket = bucket
+        self.in_flight = 0
+        self.quarantined_until = 0.0
+
+    def usable(self, now: float) -> bool:
+        return now >= self.quarantined_until
+
+
+class KeyPool:
+    """
+    Several API tokens used together, for more requests per second than
+    one token is allowed.
+
+    The API rate limits each token on its own, so every key gets its own
+    ``TokenBucket`` and each request goes out on the least loaded key:
+    one with a token to spare, then the fewest requests in flight. A 429
+    only pauses the key that got it. A key the API refuses (401/403:
+    revoked, expired, or not allowed from this IP) is quarantined for
+    `quarantine` seconds and the request is sent again on another key;
+    with every key quarantined requests fail with ``NoUsableKeyError``.
+
+    Pass the pool wherever an `api_key` goes. ``bucket`` paces a pool the
+    way ``rate_limiter`` paces a single token, at the keys' combined rate.
+
+    Parameters
+    ----------
+    tokens : list of str
+        The API tokens; duplicates are dropped.
+    rate : float
+        Requests per second allowed for each key.
+    capacity : int
+        Burst size for each key.
+    quarantine : float
+        Seconds a refused key is left out.
+    """
+
+    def __init__(
+        self,
+        tokens: Iterable[str],
+        rate: float = 10.0,
+        capacity: int = 20,
+        quarantine: float = 3600.0,
+    ):
+        tokens = [t for t in dict.fromkeys(t.strip() for t in tokens) if t]
+        self.keys = [
+            PooledKey(f"key{i}", token, TokenBucket(rate, capacity))
+            for i, token in enumerate(tokens)
+        ]
+        self.quarantine_seconds = quarantine
+        scale = max(1, len(self.keys))
+        self.bucket = TokenBucket(rate * scale, capacity * scale)
+
+    @classmethod
+    def from_env(cls) -> "KeyPool":
+        """
+        Build a pool from CR_API_KEYS (comma separated) plus CR_API_KEY,
+        with CR_RATE_LIMIT / CR_RATE_BURST per key and CR_KEY_QUARANTINE.
+        """
+        tokens = os.getenv("CR_API_KEYS", "").split(",")
+        tokens.append(os.getenv("CR_API_KEY", ""))
+        return cls(
+            tokens,
+            rate=float(os.getenv("CR_RATE_LIMIT", "10")),
+            capacity=int(os.getenv("CR_RATE_BURST", "20")),
+            quarantine=float(os.getenv("CR_KEY_QUARANTINE", "3600")),
+        )
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def usable(self) -> List[PooledKey]:
+        """Keys that aren't quarantined."""
+        now = time.monotonic()
+        keys = [key for key in self.keys if key.usable(now)]
+        Metrics.api_keys_usable.set(len(keys))
+        return keys
+
+    def ready(self) -> bool:
+        """Whether some usable key could send a request right now."""
+        return any(key.bucket.available() >= 1 for key in self.usable())
+
+    def choose(self) -> PooledKey:
+        """The least loaded usable key."""
+        keys = self.usable()
+        if not keys:
+            raise NoUsableKeyError()
+
+        def load(key: PooledKey) -> Tuple[bool, int, float]:
+            available = key.bucket.available()
+            return available < 1, key.in_flight, -available
+
+        return min(keys, key=load)
+
+    def quarantine(self, key: PooledKey) -> bool:
+        """Leave `key` out for a while; returns whether any other key is usable."""
+        now = time.monotonic()
+        already = not key.usable(now)  # Refused again by a request sent earlier
+        key.quarantined_until = now + self.quarantine_seconds
+        left = len(self.usable())
+        if not already:
+            log.warning(
+                "API refused %s, leaving it out for %.0fs (%d of %d keys left)",
+                key.name,
+                self.quarantine_seconds,
+                left,
+                len(self.keys),
+            )
+        return left > 0
+
+
+def _bucket_for(api_key: ApiKey) -> TokenBucket:
+    """The rate limiter lookups with `api_key` go through by default."""
+    return api_key.bucket if isinstance(api_key, KeyPool) else rate_limiter
+
+
+# Every key from the environment; main.py uses it once there's more than one
+key_pool = KeyPool.from_env()
+
+
+# ---------------------------------------------------------------------- #
+# Full leaderboards
+# ---------------------------------------------------------------------- #
+# Entries asked for per leaderboard request
+LEADERBOARD_PAGE_SIZE = 200
+
+
+async def _leaderboard_page(
+    client: Client,
+    url: str,
+    choice: int,
+    limit: int,
+    after: Optional[str],
+    bucket: TokenBucket,
+    max_retries: int,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a leaderboard and the cursor for the next (None at the end)."""
+    _current_choice.set(choice)  # Always runs as its own task
+    _max_retries.set(0)  # The loop below does the retrying
+    params: Dict[str, Any] = {"limit": limit}
+    if after:
+        params["after"] = after
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            data = await _get_raw(client, url, **params)
+            break
+        except RatelimitError:
+            if attempt == max_retries:
+                raise
+            bucket.penalize(2 ** attempt + random.uniform(0, 1))
+
+    if not isinstance(data, dict):
+        return list(data or ()), None
+    cursors = (data.get("paging") or {}).get("cursors") or {}
+    return data.get("items") or [], cursors.get("after")
+
+
+async def iter_leaderboard(
+    api_key: ApiKey,
+    choice: int = 5,
+    location_id: Union[int, str] = "global",
+    max_items: Optional[int] = None,
+    page_size: int = LEADERBOARD_PAGE_SIZE,
+    bucket: Optional[TokenBucket] = None,
+    max_retries: int = 4,
+) -> AsyncIterator[Union[Player, Clan]]:
+    """
+    Stream a whole leaderboard, one entry at a time, following the API's
+    ``after`` cursor from page to page.
+
+    While the caller works through one page the next one is already being
+    fetched, and only those two pages are ever held in memory. Requests
+    take tokens from the rate limiter and back off on 429 like
+    ``bulk_lookup()``. Stopping early (``break``) cancels the prefetch.
+
+    Parameters
+    ----------
+    api_key : str or KeyPool
+        Clash Royale API token, or a pool of them to spread requests over.
+    choice : int
+        5 (top players) or 6 (top clans).
+    location_id : int or str
+        ``"global"`` or a location id for a country/region leaderboard.
+    max_items : int, optional
+        Stop after this many entries. None walks the whole leaderboard.
+    page_size : int
+        Entries asked for per request.
+    bucket : TokenBucket, optional
+        Rate limiter to use; defaults to the process-wide ``rate_limiter``
+        (or the pool's bucket when `api_key` is a ``KeyPool``).
+    max_retries : int
+        How many times a rate-limited page is retried before giving up.
+
+    Yields
+    ------
+    Player (choice 5) or Clan (choice 6)
+
+    Raises
+    ------
+    ValueError
+        For any choice other than 5 or 6, or a location that isn't
+        ``"global"`` or a number.
+    clashroyale.errors.RequestError
+        When a page can't be fetched (bad token, unknown location, 429
+        after every retry, ...); entries already yielded stay valid.
+    """
+    if choice not in (5, 6):
+        raise ValueError("Leaderboards are choices 5 (players) and 6 (clans).")
+    location_id = str(location_id)
+    # It goes into the URL path, so nothing else may reach other endpoints
+    if location_id != "global" and not (
+        location_id.isascii() and location_id.isdigit()
+    ):
+        raise ValueError("The location must be 'global' or a location id.")
+    if max_items is not None and max_items <= 0:
+        return
+
+    model = Player if choice == 5 else Clan
+    kind = "players" if choice == 5 else "clans"
+    client = await client_manager.get_client(api_key)
+    url = f"{client.api.LOCATIONS}/{location_id}/rankings/{kind}"
+    bucket = bucket or _bucket_for(api_key)
+    if max_items is not None:
+        page_size = min(page_size, max_items)
+
+    def fetch(after: Optional[str]) -> asyncio.Task:
+        return asyncio.ensure_future(
+            _leaderboard_page(
+                client, url, choice, page_size, after, bucket, max_retries
+            )
+        )
+
+    pending: Optional[asyncio.Task] = fetch(None)
+    served = 0
+    try:
+        while pending is not None:
+            items, cursor = await pending
+            pending = None
+            if max_items is not None:
+                items = items[: max_items - served]
+            # Start on the next page before handing this one out
+            last = max_items is not None and served + len(items) >= max_items
+            if cursor and items and not last:
+                pending = fetch(cursor)
+            for item in items:
+                yield model.from_json(item)
+                served += 1
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,405 @@
+"""
+Deck_Analytics
+~~~~~~~~~~~~~~
+
+Win-rate statistics over the stored battle history, computed with NumPy.
+
+Looping over millions of battles in Python (one dict per battle) is far
+too slow, so the battles are loaded once into columns:
+
+    team_decks / opponent_decks   (n, 8) int32 card indexes, -1 = empty slot
+    team_bits                     (n, words) uint64 bitsets of the team deck
+    won / drawn                   (n,) bool
+    elixir                        (n,) float32 average elixir of the team deck
+
+and every statistic is a handful of whole-array operations (bincount,
+unique, bit masks) on those columns. The statistics are per 8-card deck,
+so 2v2 battles (two decks a side) are left out and counted in
+``skipped_team_battles``.
+
+Build one with ``DeckAnalytics.from_store()`` (everything in battles.db,
+optionally only one player's battles) or ``DeckAnalytics.from_battles()``
+(e.g. straight from ``initialize(choice=2)``); ``cached_from_store()``
+hands out the last one built until a battle is added or the card
+catalog changes. Then call:
+
+    card_win_rates()           win rate of decks containing each card
+    opponent_card_win_rates()  our win rate against each opponent card
+    archetype_win_rates()      win rate per exact 8-card deck
+    elixir_win_rates()         win rate per average elixir (0.5 steps)
+    with_cards(ids)            the same analytics, only decks with those cards
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from Battle_Store import BattleStore, battle_store
+from Card_Catalog import CardCatalog, card_catalog
+from Data_Models import Battle, normalise_tag
+
+DECK_SIZE = 8
+
+# How many built analytics cached_from_store() keeps (the whole history
+# plus the players looked at last)
+CACHE_SIZE = 16
+
+# (store path, player tag, catalog) -> ((battles, catalog version), analytics)
+_built: "OrderedDict[tuple, Tuple[tuple, DeckAnalytics]]" = OrderedDict()
+_built_lock = threading.Lock()
+
+
+def _parse_id_lists(values: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """'1,2,3' strings -> (flat int64 ids, number of ids per string)."""
+    lengths = np.fromiter(
+        (v.count(",") + 1 if v else 0 for v in values),
+        dtype=np.int64,
+        count=len(values),
+    )
+    joined = ",".join(v for v in values if v)
+    if not joined:
+        return np.empty(0, dtype=np.int64), lengths
+    return np.array(joined.split(","), dtype=np.int64), lengths
+
+
+def _card_count(value: str) -> int:
+    return value.count(",") + 1 if value else 0
+
+
+def _to_matrix(flat_index: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Flat per-battle card indexes -> (n, DECK_SIZE) matrix padded with -1."""
+    n = len(lengths)
+    matrix = np.full((n, DECK_SIZE), -1, dtype=np.int32)
+    if not len(flat_index):
+        return matrix
+    rows = np.repeat(np.arange(n), lengths)
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    cols = np.arange(len(flat_index)) - starts
+    keep = cols < DECK_SIZE
+    matrix[rows[keep], cols[keep]] = flat_index[keep]
+    return matrix
+
+
+class DeckAnalytics:
+    """
+    Columnar view of a set of battles, from one side's point of view.
+
+    Parameters
+    ----------
+    team_cards, opponent_cards : sequence of str
+        Comma-separated card ids of each battle's two decks. A side with
+        more than ``DECK_SIZE`` cards (a 2v2 team) skips the battle.
+    team_crowns, opponent_crowns : sequence of int
+        Crowns each side won (None counts as 0).
+    catalog : CardCatalog, optional
+        Used for card names and elixir costs.
+    """
+
+    def __init__(
+        self,
+        team_cards: Sequence[str],
+        opponent_cards: Sequence[str],
+        team_crowns: Sequence[Optional[int]],
+        opponent_crowns: Sequence[Optional[int]],
+        catalog: Optional[CardCatalog] = None,
+    ):
+        self.catalog = catalog if catalog is not None else card_catalog
+
+        keep = [
+            _card_count(team) <= DECK_SIZE and _card_count(opponent) <= DECK_SIZE
+            for team, opponent in zip(team_cards, opponent_cards)
+        ]
+        self.skipped_team_battles = len(keep) - sum(keep)
+        if self.skipped_team_battles:
+            columns = (team_cards, opponent_cards, team_crowns, opponent_crowns)
+            team_cards, opponent_cards, team_crowns, opponent_crowns = (
+                [value for value, wanted in zip(column, keep) if wanted]
+                for column in columns
+            )
+
+        team_flat, team_lengths = _parse_id_lists(team_cards)
+        opp_flat, opp_lengths = _parse_id_lists(opponent_cards)
+
+        # One shared, dense index for every card id seen on either side
+        self.card_ids, inverse = np.unique(
+            np.concatenate([team_flat, opp_flat]), return_inverse=True
+        )
+        inverse = inverse.astype(np.int32)
+        self.team_decks = _to_matrix(inverse[: len(team_flat)], team_lengths)
+        self.opponent_decks = _to_matrix(inverse[len(team_flat):], opp_lengths)
+
+        ours = np.array([c or 0 for c in team_crowns], dtype=np.int16)
+        theirs = np.array([c or 0 for c in opponent_crowns], dtype=np.int16)
+        self.won = ours > theirs
+        self.drawn = ours == theirs
+
+        self.team_bits = self._bitsets(self.team_decks)
+        self.elixir = self._average_elixir(self.team_decks)
+
+    # ------------------------------------------------------------------ #
+    # Building
+    # ------------------------------------------------------------------ #
+    @classmethod
+    def from_store(
+        cls,
+        store: Optional[BattleStore] = None,
+        player_tag: Optional[str] = None,
+        catalog: Optional[CardCatalog] = None,
+    ) -> "DeckAnalytics":
+        """Every stored battle, or only `player_tag`'s (from their side)."""
+        store = store if store is not None else battle_store
+        rows = store.card_columns(player_tag)
+        columns = list(zip(*rows)) if rows else ([], [], [], [])
+        return cls(*columns, catalog=catalog)
+
+    @classmethod
+    def cached_from_store(
+        cls,
+        store: Optional[BattleStore] = None,
+        player_tag: Optional[str] = None,
+        catalog: Optional[CardCatalog] = None,
+    ) -> "DeckAnalytics":
+        """
+        ``from_store()``, but the same instance is handed out again until
+        a battle is added to `store` or `catalog` is updated, so only the
+        first request after a change pays for reading and parsing the
+        history. Treat the result as read-only (``with_cards()`` returns
+        a new one).
+        """
+        store = store if store is not None else battle_store
+        catalog = catalog if catalog is not None else card_catalog
+        tag = normalise_tag(player_tag) if player_tag else None
+        key = (store.path, tag, id(catalog))
+        # Read before building: a battle added meanwhile only means the
+        # next request builds again
+        version = (store.version(), catalog.version)
+        with _built_lock:
+            cached = _built.get(key)
+            if cached is not None and cached[0] == version:
+                _built.move_to_end(key)
+                return cached[1]
+
+        stats = cls.from_store(store, player_tag, catalog)
+        with _built_lock:
+            _built[key] = (version, stats)
+            _built.move_to_end(key)
+            while len(_built) > CACHE_SIZE:
+                _built.popitem(last=False)
+        return stats
+
+    @classmethod
+    def from_battles(
+        cls,
+        battles: Iterable[Battle],
+        player_tag: Optional[str] = None,
+        catalog: Optional[CardCatalog] = None,
+    ) -> "DeckAnalytics":
+        """
+        Battles as returned by ``initialize(choice=2)``.
+
+        If `player_tag` is given, battles where that player is on the
+        opponent side are flipped so the stats are from their side.
+        """
+        player_tag = normalise_tag(player_tag) if player_tag else None
+        team_cards, opponent_cards, team_crowns, opponent_crowns = [], [], [], []
+        for battle in battles:
+            team, opponent = battle.team, battle.opponent
+            if (
+                player_tag
+                and opponent
+                and opponent[0].tag
+                and normalise_tag(opponent[0].tag) == player_tag
+            ):
+                team, opponent = opponent, team
+            team_cards.append(",".join(str(c.id) for p in team for c in p.cards))
+            opponent_cards.append(
+                ",".join(str(c.id) for p in opponent for c in p.cards)
+            )
+            team_crowns.append(team[0].crowns if team else 0)
+            opponent_crowns.append(opponent[0].crowns if opponent else 0)
+        return cls(
+            team_cards, opponent_cards, team_crowns, opponent_crowns, catalog=catalog
+        )
+
+    def _bitsets(self, decks: np.ndarray) -> np.ndarray:
+        """One bit per card: bit i of row r is set if deck r contains card i."""
+        words = max(1, -(-len(self.card_ids) // 64))
+        bits = np.zeros((len(decks), words), dtype=np.uint64)
+        rows = np.arange(len(decks))
+        # One slot at a time, so no (row, word) pair repeats within an update
+        for slot in range(decks.shape[1]):
+            index = decks[:, slot]
+            has = index >= 0
+            bits[rows[has], index[has] // 64] |= np.left_shift(
+                np.uint64(1), (index[has] % 64).astype(np.uint64)
+            )
+        return bits
+
+    def _average_elixir(self, decks: np.ndarray) -> np.ndarray:
+        costs = np.full(len(self.card_ids), np.nan, dtype=np.float32)
+        for index, card_id in enumerate(self.card_ids):
+            card = self.catalog.get(int(card_id))
+            if card is not None and card.elixir_cost is not None:
+                costs[index] = card.elixir_cost
+        if not len(costs):
+            return np.full(len(decks), np.nan, dtype=np.float32)
+        per_slot = np.where(decks >= 0, costs[np.maximum(decks, 0)], np.nan)
+        known = ~np.isnan(per_slot)
+        counts = known.sum(axis=1)
+        totals = np.where(known, per_slot, 0).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return (totals / counts).astype(np.float32)
+
+    # ------------------------------------------------------------------ #
+    # Statistics
+    # ------------------------------------------------------------------ #
+    def __len__(self) -> int:
+        return len(self.won)
+
+    def _card_name(self, index: int) -> str:
+        card_id = int(self.card_ids[index])
+        card = self.catalog.get(card_id)
+        return card.name if card and card.name else str(card_id)
+
+    @staticmethod
+    def _table(
+        label_of: Callable[[int], Any],
+        games: np.ndarray,
+        wins: np.ndarray,
+        draws: np.ndarray,
+        min_games: int,
+        top: Optional[int],
+    ) -> List[Dict[str, Any]]:
+        """Rows sorted by win rate (then games), with at least `min_games`."""
+        keep = np.flatnonzero(games >= max(1, min_games))
+        rates = wins[keep] / games[keep]
+        order = keep[np.lexsort((-games[keep], -rates))]
+        if top is not None:
+            order = order[:top]
+        return [
+            {
+                "label": label_of(i),
+                "games": int(games[i]),
+                "wins": int(wins[i]),
+                "draws": int(draws[i]),
+                "win_rate": float(wins[i] / games[i]),
+            }
+            for i in order
+        ]
+
+    def _per_card(
+        self, decks: np.ndarray, min_games: int, top: Optional[int]
+    ) -> List[Dict[str, Any]]:
+        has = decks >= 0
+        index = decks[has]
+        won = np.broadcast_to(self.won[:, None], decks.shape)[has]
+        drawn = np.broadcast_to(self.drawn[:, None], decks.shape)[has]
+        size = len(self.card_ids)
+        games = np.bincount(index, minlength=size)
+        wins = np.bincount(index, weights=won, minlength=size)
+        draws = np.bincount(index, weights=drawn, minlength=size)
+        return self._table(self._card_name, games, wins, draws, min_games, top)
+
+    def card_win_rates(
+        self, min_games: int = 1, top: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Win rate of the decks that contained each card."""
+        return self._per_card(self.team_decks, min_games, top)
+
+    def opponent_card_win_rates(
+        self, min_games: int = 1, top: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Our win rate in battles where the opponent played each card."""
+        return self._per_card(self.opponent_decks, min_games, top)
+
+    def archetype_win_rates(
+        self, min_games: int = 1, top: Optional[int] = 20
+    ) -> List[Dict[str, Any]]:
+        """Win rate per exact deck (same 8 cards in any order)."""
+        if not len(self):
+            return []
+        decks = np.sort(self.team_decks, axis=1)
+        # Pack each sorted deck into a single int64 when the card indexes
+        # fit, unique() on one column is much faster than on rows
+        bits = int(len(self.card_ids) + 1).bit_length()
+        if bits * DECK_SIZE <= 63:
+            keys = np.zeros(len(decks), dtype=np.int64)
+            for slot in range(DECK_SIZE):
+                keys = (keys << bits) | (decks[:, slot].astype(np.int64) + 1)
+            _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+            decks = decks[first]
+        else:
+            decks, inverse = np.unique(decks, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        games = np.bincount(inverse, minlength=len(decks))
+        wins = np.bincount(inverse, weights=self.won, minlength=len(decks))
+        draws = np.bincount(inverse, weights=self.drawn, minlength=len(decks))
+
+        def label_of(row: int) -> str:
+            return ", ".join(self._card_name(i) for i in decks[row] if i >= 0)
+
+        return self._table(label_of, games, wins, draws, min_games, top)
+
+    def elixir_win_rates(self, min_games: int = 1) -> List[Dict[str, Any]]:
+        """Win rate per average deck elixir, rounded to the nearest 0.5."""
+        known = ~np.isnan(self.elixir)
+        if not known.any():
+            return []
+        buckets, inverse = np.unique(
+            np.round(self.elixir[known] * 2) / 2, return_inverse=True
+        )
+        size = len(buckets)
+        games = np.bincount(inverse, minlength=size)
+        wins = np.bincount(inverse, weights=self.won[known], minlength=size)
+        draws = np.bincount(inverse, weights=self.drawn[known], minlength=size)
+        rows = self._table(
+            lambda i: float(buckets[i]), games, wins, draws, min_games, None
+        )
+        return sorted(rows, key=lambda row: row["label"])
+
+    def with_cards(self, card_ids: Iterable[int]) -> "DeckAnalytics":
+        """
+        The same analytics, restricted to team decks containing every card.
+
+        No cards at all matches no decks (not every deck), so a filter
+        whose cards were all unknown never passes for the whole history.
+        """
+        card_ids = [int(card_id) for card_id in card_ids]
+        if not card_ids:
+            return self._subset(np.zeros(len(self), dtype=bool))
+        wanted = np.searchsorted(self.card_ids, np.array(card_ids, dtype=np.int64))
+        query = np.zeros(self.team_bits.shape[1], dtype=np.uint64)
+        for index, card_id in zip(wanted, card_ids):
+            if index >= len(self.card_ids) or self.card_ids[index] != card_id:
+                return self._subset(np.zeros(len(self), dtype=bool))
+            query[index // 64] |= np.uint64(1) << np.uint64(index % 64)
+        return self._subset(np.all((self.team_bits & query) == query, axis=1))
+
+    def _subset(self, mask: np.ndarray) -> "DeckAnalytics":
+        subset = object.__new__(DeckAnalytics)
+        subset.catalog = self.catalog
+        subset.skipped_team_battles = self.skipped_team_battles
+        subset.card_ids = self.card_ids
+        subset.team_decks = self.team_decks[mask]
+        subset.opponent_decks = self.opponent_decks[mask]
+        subset.won = self.won[mask]
+        subset.drawn = self.drawn[mask]
+        subset.team_bits = self.team_bits[mask]
+        subset.elixir = self.elixir[mask]
+        return subset
+
+    def summary(self) -> Dict[str, Any]:
+        """Battles, wins, draws and overall win rate."""
+        games = len(self)
+        wins = int(self.won.sum())
+        return {
+            "games": games,
+            "wins": wins,
+            "draws": int(self.drawn.sum()),
+            "win_rate": wins / games if games else None,
+            "skipped_team_battles": self.skipped_team_battles,
+        }
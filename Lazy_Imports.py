@@ -0,0 +1,75 @@
+"""
+Lazy_Imports
+~~~~~~~~~~~~
+
+Modules that are only imported the first time something in them is used.
+
+``Data_Searcher`` brings the whole API client stack with it (aiohttp,
+requests, both clashroyale clients and their models, numpy), which is
+most of the time it takes to import ``main.py``. Pages like ``/home``
+need none of it, so ``main.py`` holds those modules as
+
+    Data_Searcher = lazy_module("Data_Searcher")
+
+and a worker only pays for the import on the first request that calls
+``Data_Searcher.initialize(...)`` (or anything else in it). With
+``CR_EAGER_IMPORTS=1`` everything is imported straight away instead,
+which is what you want when a server imports the app once and then
+forks its workers from it (gunicorn ``--preload``).
+"""
+
+from __future__ import annotations
+
+import importlib
+import os
+import sys
+import types
+from typing import Any, List
+
+_lazy_modules: List["LazyModule"] = []
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is looked up."""
+
+    _module = None
+
+    def _load(self) -> types.ModuleType:
+        if self._module is None:
+            # The import system's own lock makes two threads arriving at
+            # once share one import
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for names the stand-in itself doesn't have, so every
+        # lookup goes to the real module and sees its current globals
+        return getattr(self._load(), name)
+
+    def __dir__(self) -> List[str]:
+        return dir(self._load())
+
+
+def lazy_module(name: str) -> types.ModuleType:
+    """
+    `name`, imported on first use (or the module itself if it's already
+    imported, or CR_EAGER_IMPORTS is set).
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if os.getenv("CR_EAGER_IMPORTS", "") not in ("", "0"):
+        return importlib.import_module(name)
+    module = LazyModule(name)
+    _lazy_modules.append(module)
+    return module
+
+
+def is_loaded(module: types.ModuleType) -> bool:
+    """Whether `module` has been imported (always True for a real module)."""
+    return module.__name__ in sys.modules
+
+
+def load_all() -> None:
+    """Import every module handed out by ``lazy_module()`` now."""
+    for module in _lazy_modules:
+        module._load()
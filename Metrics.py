@@ -0,0 +1,260 @@
+"""
+Metrics
+~~~~~~~
+
+Counters, gauges and latency histograms for the API lookups and the
+Flask views, rendered in the Prometheus text format on ``/metrics``
+(every name below starts with ``cr_``).
+
+    lookup_seconds{choice}            initialize() from call to answer
+    upstream_seconds{choice}          each real request to the API
+    upstream_errors_total{choice,error}  ratelimit / timeout / ...
+    upstream_retries_total{choice,reason}
+    circuit_open{choice}              1 while that choice's breaker is open
+    memory_cache_total{choice,result} response_cache hit / miss
+    sqlite_cache_total{result}        clash_cache.db hit / miss
+    upstream_in_flight                requests to the API right now
+    api_key_requests_total{key}       requests sent on each key of a KeyPool
+    api_keys_usable                   keys in the pool that aren't quarantined
+    http_request_seconds{endpoint}    every Flask view
+    http_requests_total{endpoint,status}
+    http_requests_in_flight
+
+Everything is kept in this process (one set per worker) and is safe to
+update from the background loop and the Flask threads at once.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Histogram buckets (seconds), from a memory-cache hit to a slow API call
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+PREFIX = "cr_"
+
+
+def _label_text(
+    names: Sequence[str], values: Tuple[str, ...], extra: str = ""
+) -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.kind}",
+        ] + self._samples()
+
+
+class Counter(_Metric):
+    """A number that only goes up."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        # Without labels there's one series, shown as 0 until it's used
+        self._values: Dict[Tuple[str, ...], float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_label_text(self.labels, key)} {_number(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """A number that goes up and down (e.g. requests in flight)."""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels: object) -> Iterator[None]:
+        """+1 for as long as the block runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """How long things took, counted into ``LATENCY_BUCKETS``."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observe how long the block took."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(
+                (key, (list(counts), total[0]))
+                for key, (counts, total) in self._values.items()
+            )
+        lines = []
+        for key, (counts, total) in items:
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                labels = _label_text(self.labels, key, 'le="%s"' % _number(bound))
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            labels = _label_text(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {running}")
+        return lines
+
+
+# ---------------------------------------------------------------------- #
+# The metrics themselves
+# ---------------------------------------------------------------------- #
+lookup_seconds = Histogram(
+    "lookup_seconds", "Time for initialize() to answer, by choice.", ["choice"]
+)
+upstream_seconds = Histogram(
+    "upstream_seconds", "Time of each request sent to the API.", ["choice"]
+)
+upstream_errors = Counter(
+    "upstream_errors_total", "Failed requests to the API.", ["choice", "error"]
+)
+upstream_retries = Counter(
+    "upstream_retries_total", "Requests to the API retried.", ["choice", "reason"]
+)
+upstream_in_flight = Gauge("upstream_in_flight", "Requests to the API right now.")
+circuit_open = Gauge(
+    "circuit_open", "1 while the API circuit breaker for a choice is open.", ["choice"]
+)
+api_key_requests = Counter(
+    "api_key_requests_total", "Requests sent on each key of the pool.", ["key"]
+)
+api_keys_usable = Gauge("api_keys_usable", "Keys in the pool not quarantined.")
+memory_cache = Counter(
+    "memory_cache_total", "response_cache lookups.", ["choice", "result"]
+)
+sqlite_cache = Counter("sqlite_cache_total", "clash_cache.db lookups.", ["result"])
+http_request_seconds = Histogram(
+    "http_request_seconds", "Time spent in each Flask view.", ["endpoint"]
+)
+http_requests = Counter(
+    "http_requests_total",
+    "Responses sent, by view and status.",
+    ["endpoint", "status"],
+)
+http_in_flight = Gauge("http_requests_in_flight", "Flask requests being handled.")
+
+ALL_METRICS = (
+    lookup_seconds,
+    upstream_seconds,
+    upstream_errors,
+    upstream_retries,
+    upstream_in_flight,
+    circuit_open,
+    api_key_requests,
+    api_keys_usable,
+    memory_cache,
+    sqlite_cache,
+    http_request_seconds,
+    http_requests,
+    http_in_flight,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,98 @@
+"""
+Page_Cache
+~~~~~~~~~~
+
+Conditional responses and a rendered-page cache for the HTML views.
+
+``render_cached(template, **context)`` is a drop-in for Flask's
+``render_template``. It hashes the context (the data the page shows,
+which already only holds what the user ticked) and the templates'
+source into an ETag, and then:
+
+    - answers ``304 Not Modified`` straight away when a GET's
+      ``If-None-Match`` already has that ETag (nothing is rendered);
+    - otherwise reuses the HTML rendered last time for the same ETag
+      from ``page_cache``, and only renders on a miss.
+
+The data a view gets back from ``Data_Searcher`` is usually served from
+its memory cache, so a repeated view costs one hash and a dict lookup.
+Responses carry ``ETag``, ``Last-Modified`` (when that version of the
+page was first rendered) and ``Cache-Control: no-cache`` so browsers
+revalidate instead of showing old data.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import time
+from email.utils import formatdate
+from typing import Any, Dict
+
+from flask import current_app, make_response, render_template, request
+
+from Data_Searcher import TTLCache
+
+# How long a rendered page is kept (seconds); the ETag changes with the
+# data, so this only bounds how long unused pages take up memory
+PAGE_CACHE_TTL = 600
+
+# ETag -> (html, first rendered at)
+page_cache = TTLCache(int(os.getenv("CR_PAGE_CACHE_SIZE", "256")))
+
+# id(jinja environment) -> template_version()
+_template_versions: Dict[int, str] = {}
+
+
+def template_version() -> str:
+    """
+    A hash of every template's source, so a deploy that changes a page
+    (or the layout it extends) changes its ETags too. Worked out once
+    per process, or on every call while templates auto-reload (debug).
+    """
+    env = current_app.jinja_env
+    version = None if env.auto_reload else _template_versions.get(id(env))
+    if version is None:
+        digest = hashlib.blake2b(digest_size=8)
+        for name in env.list_templates():
+            source, _filename, _uptodate = env.loader.get_source(env, name)
+            digest.update(name.encode() + b"\0" + source.encode() + b"\0")
+        version = _template_versions[id(env)] = digest.hexdigest()
+    return version
+
+
+def page_etag(template_name: str, context: dict) -> str:
+    """A hash of the templates, the template name and everything passed in."""
+    payload = pickle.dumps(
+        (template_version(), template_name, sorted(context.items())),
+        protocol=pickle.HIGHEST_PROTOCOL,
+    )
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def render_cached(template_name: str, **context: Any):
+    """
+    ``render_template`` with ETags, 304s and a rendered-page cache.
+
+    Only GET requests get 304s (a browser never revalidates a POST), but
+    POSTs share the rendered-page cache.
+    """
+    etag = page_etag(template_name, context)
+
+    if request.method == "GET" and request.if_none_match.contains(etag):
+        response = make_response("", 304)
+        response.set_etag(etag)
+        return response
+
+    cached = page_cache.get(etag)
+    if cached is None:
+        cached = (render_template(template_name, **context), time.time())
+        page_cache.set(etag, cached, PAGE_CACHE_TTL)
+    html, rendered_at = cached
+
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers["Last-Modified"] = formatdate(rendered_at, usegmt=True)
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,406 @@
+"""
+Replay_Archive
+~~~~~~~~~~~~~~
+
+Recorded API responses, for running the app without the API: load tests
+that shouldn't spend a real quota, and a fallback while the API is down.
+
+``Data_Searcher`` runs in one of three modes, picked with ``CR_MODE``:
+
+    live    (default) every request goes to the API
+    record  the same, and every answer is also appended to the journal
+    replay  nothing goes to the API; answers come from the archive
+
+The archive (``CR_ARCHIVE``, default ``api_archive.cra``) holds one
+answer per endpoint and tag, keyed like ``players/#TAG/battlelog`` or
+``locations/global/rankings/players?limit=200``. Recording only writes
+to ``<archive>.journal`` (one JSON line per answer); the CLI turns the
+journal into the archive:
+
+    python Replay_Archive.py build     # add the journal to the archive
+    python Replay_Archive.py compact   # drop answers that were replaced
+    python Replay_Archive.py stats
+
+The archive is one file: zlib-compressed answers one after another, then
+an index of every key's hash, offset, length and status code as sorted
+columns, then a footer saying where the index starts. Building appends
+new answers and a new index after the old ones, so it never rewrites
+what's already there; ``compact`` rewrites the file with only the
+answers the latest index points at.
+
+Replaying maps the file into memory and binary-searches the index in
+place, so opening even a large archive reads nothing but the footer,
+and each lookup only touches the pages of its own answer.
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import zlib
+from typing import Dict, Iterator, Optional, Tuple
+from urllib.parse import unquote, urlencode
+
+from clashroyale.errors import RequestError
+
+log = logging.getLogger(__name__)
+
+MODES = ("live", "record", "replay")
+
+MAGIC = b"CRARCH01"
+# index offset, number of entries, magic
+_FOOTER = struct.Struct("<QQ8s")
+# Widths of the index columns: key hash, offset, length, status code
+_COLUMNS = (("Q", 8), ("Q", 8), ("I", 4), ("H", 2))
+_ENTRY_SIZE = sum(size for _, size in _COLUMNS)
+
+# Request parameters that aren't part of what was asked for
+_NOT_KEYED = ("timeout", "method", "json")
+
+
+class ReplayMissError(RequestError):
+    """Raised in replay mode for a request the archive has no answer to."""
+
+    def __init__(self, key: str):
+        self.code = 503
+        self.key = key
+        self.error = "No recorded answer for " + key
+        super().__init__(self.error)
+
+
+def archive_key(path: str, params: Optional[dict] = None) -> str:
+    """
+    The key an answer is stored under: the URL path after the API's base
+    URL (unquoted, so ``players/#TAG``) plus the sorted query parameters.
+    """
+    key = unquote(path).strip("/")
+    query = sorted(
+        (name, value)
+        for name, value in (params or {}).items()
+        if name not in _NOT_KEYED and value is not None
+    )
+    return key + ("?" + urlencode(query) if query else "")
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(key.encode("utf8"), digest_size=8).digest(), "little"
+    )
+
+
+def _pack_record(key: str, body: str, level: int) -> bytes:
+    return zlib.compress(key.encode("utf8") + b"\n" + body.encode("utf8"), level)
+
+
+def _unpack_record(data: bytes) -> Tuple[str, str]:
+    key, _, body = zlib.decompress(data).partition(b"\n")
+    return key.decode("utf8"), body.decode("utf8")
+
+
+class ReplayArchive:
+    """
+    A read-only view of an archive file, opened lazily on first lookup.
+
+    Parameters
+    ----------
+    path : str
+        The archive file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._opened = False
+        self._map: Optional[mmap.mmap] = None
+        self._views: list = []
+        self._columns: Tuple[memoryview, ...] = ()
+
+    def _open(self) -> None:
+        with self._lock:
+            if self._opened:
+                return
+            try:
+                with open(self.path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size > _FOOTER.size:
+                        self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except OSError:
+                log.warning("No replay archive at %s", self.path)
+            if self._map is not None:
+                index_at, count, magic = _FOOTER.unpack_from(
+                    self._map, len(self._map) - _FOOTER.size
+                )
+                if magic != MAGIC:
+                    raise ValueError(self.path + " is not a replay archive")
+                # Each column is read straight out of the mapped file
+                self._views = [memoryview(self._map)]
+                columns = []
+                for fmt, size in _COLUMNS:
+                    raw = self._views[0][index_at : index_at + count * size]
+                    columns.append(raw.cast(fmt))
+                    self._views += [raw, columns[-1]]
+                    index_at += count * size
+                self._columns = tuple(columns)
+            self._opened = True
+
+    def __len__(self) -> int:
+        self._open()
+        return len(self._columns[0]) if self._columns else 0
+
+    def get(self, key: str) -> Optional[Tuple[int, str]]:
+        """``(status, body)`` recorded for `key`, or None."""
+        self._open()
+        if not self._columns:
+            return None
+        hashes, offsets, lengths, statuses = self._columns
+        wanted = _hash(key)
+        i = bisect.bisect_left(hashes, wanted)
+        while i < len(hashes) and hashes[i] == wanted:
+            start = offsets[i]
+            stored_key, body = _unpack_record(self._map[start : start + lengths[i]])
+            if stored_key == key:  # Not just a hash collision
+                return statuses[i], body
+            i += 1
+        return None
+
+    def entries(self) -> Iterator[Tuple[int, int, int, int]]:
+        """``(hash, offset, length, status)`` for every key, by hash."""
+        self._open()
+        if self._columns:
+            yield from zip(*self._columns)
+
+    def close(self) -> None:
+        with self._lock:
+            self._columns = ()
+            # The map can only be closed once nothing points into it
+            for view in reversed(self._views):
+                view.release()
+            self._views = []
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            self._opened = False
+
+
+# ---------------------------------------------------------------------- #
+# Recording
+# ---------------------------------------------------------------------- #
+class Journal:
+    """Where record mode appends answers, one JSON line each."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def add(self, key: str, status: int, body: str) -> None:
+        line = json.dumps({"key": key, "status": status, "body": body})
+        with self._lock:
+            with open(self.path, "a", encoding="utf8") as f:
+                f.write(line + "\n")
+
+    def read(self) -> Iterator[Tuple[str, int, str]]:
+        try:
+            f = open(self.path, "r", encoding="utf8")
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short when recording stopped
+                yield entry["key"], entry["status"], entry["body"]
+
+
+class Recorder:
+    """
+    The mode ``Data_Searcher`` is in, with its archive and journal.
+
+    Parameters
+    ----------
+    mode : str
+        ``"live"``, ``"record"`` or ``"replay"``.
+    path : str
+        The archive; the journal is this plus ``.journal``.
+    """
+
+    def __init__(self, mode: str = "live", path: str = "api_archive.cra"):
+        if mode not in MODES:
+            raise ValueError("CR_MODE must be one of: " + ", ".join(MODES))
+        self.mode = mode
+        self.archive = ReplayArchive(path)
+        self.journal = Journal(path + ".journal")
+
+    @classmethod
+    def from_env(cls) -> "Recorder":
+        """Build it from CR_MODE and CR_ARCHIVE."""
+        return cls(
+            os.getenv("CR_MODE", "live").strip().lower() or "live",
+            os.getenv("CR_ARCHIVE", "api_archive.cra"),
+        )
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def record(self, path: str, params: dict, status: int, body: str) -> None:
+        """Save an answer, unless it only says the API was struggling."""
+        if not (200 <= status < 300 or status == 404):
+            return
+        try:
+            self.journal.add(archive_key(path, params), status, body)
+        except OSError:
+            log.exception("Recording an answer to %s failed", self.journal.path)
+
+    def replay(self, path: str, params: dict) -> Tuple[int, str]:
+        """The recorded ``(status, body)``; raises ReplayMissError if there's none."""
+        key = archive_key(path, params)
+        found = self.archive.get(key)
+        if found is None:
+            raise ReplayMissError(key)
+        return found
+
+
+# The mode the whole process runs in
+recorder = Recorder.from_env()
+
+
+# ---------------------------------------------------------------------- #
+# Building and compacting
+# ---------------------------------------------------------------------- #
+def _write_index(f, entries: Dict[int, Tuple[int, int, int]]) -> None:
+    """Write the index columns for `entries` (hash -> offset, length, status)."""
+    index_at = f.tell()
+    hashes = sorted(entries)
+    columns = (
+        hashes,
+        [entries[h][0] for h in hashes],
+        [entries[h][1] for h in hashes],
+        [entries[h][2] for h in hashes],
+    )
+    for (fmt, _), values in zip(_COLUMNS, columns):
+        f.write(struct.pack("<%d%s" % (len(values), fmt), *values))
+    f.write(_FOOTER.pack(index_at, len(hashes), MAGIC))
+
+
+def _pad(f) -> None:
+    """Line the index up on 8 bytes, so its columns can be read in place."""
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def build(path: str, level: int = 6) -> int:
+    """
+    Add everything in the journal to the archive at `path` (created if
+    needed), then delete the journal. A key recorded again replaces the
+    older answer. Returns how many answers were added.
+    """
+    journal = Journal(path + ".journal")
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    if os.path.exists(path):
+        existing = ReplayArchive(path)
+        entries.update(
+            (h, (offset, length, status))
+            for h, offset, length, status in existing.entries()
+        )
+        existing.close()
+
+    added = 0
+    with open(path, "ab") as f:
+        if f.tell() == 0:
+            f.write(MAGIC)
+        for key, status, body in journal.read():
+            record = _pack_record(key, body, level)
+            entries[_hash(key)] = (f.tell(), len(record), status)
+            f.write(record)
+            added += 1
+        if not added and f.tell() > len(MAGIC):
+            return 0  # Nothing new, the current index still stands
+        _pad(f)
+        _write_index(f, entries)
+    try:
+        os.remove(journal.path)
+    except FileNotFoundError:
+        pass
+    return added
+
+
+def compact(path: str, level: Optional[int] = None) -> Tuple[int, int]:
+    """
+    Rewrite the archive at `path` with only the answers its index points
+    at (recompressed if `level` is given). Returns the size before and
+    after, in bytes.
+    """
+    before = os.path.getsize(path)
+    archive = ReplayArchive(path)
+    archive._open()
+    tmp_path = path + ".tmp"
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for h, offset, length, status in archive.entries():
+            record = archive._map[offset : offset + length]
+            if level is not None:
+                record = _pack_record(*_unpack_record(record), level)
+            entries[h] = (f.tell(), len(record), status)
+            f.write(record)
+        _pad(f)
+        _write_index(f, entries)
+    archive.close()
+    os.replace(tmp_path, path)
+    return before, os.path.getsize(path)
+
+
+def stats(path: str) -> Dict[str, int]:
+    """How many answers the archive has and how much of the file they use."""
+    archive = ReplayArchive(path)
+    entries = list(archive.entries())
+    archive.close()
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    live = sum(length for _, _, length, _ in entries)
+    return {
+        "answers": len(entries),
+        "bytes": size,
+        "answer_bytes": live,
+        "index_bytes": len(entries) * _ENTRY_SIZE + _FOOTER.size,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Build, compact and inspect the replay archive."
+    )
+    parser.add_argument("command", choices=("build", "compact", "stats"))
+    parser.add_argument(
+        "--archive",
+        default=os.getenv("CR_ARCHIVE", "api_archive.cra"),
+        help="archive file (CR_ARCHIVE)",
+    )
+    parser.add_argument(
+        "--level", type=int, default=None, help="zlib level, 1 (fast) to 9 (small)"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        added = build(args.archive, 6 if args.level is None else args.level)
+        print(f"added {added} answers to {args.archive}")
+    elif args.command == "compact":
+        if not os.path.exists(args.archive):
+            parser.error(f"{args.archive} doesn't exist")
+        before, after = compact(args.archive, args.level)
+        print(f"{args.archive}: {before} -> {after} bytes")
+    else:
+        print(json.dumps(stats(args.archive)))
+
+
+if __name__ == "__main__":
+    main()
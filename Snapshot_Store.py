@@ -0,0 +1,383 @@
+"""
+Snapshot_Store
+~~~~~~~~~~~~~~
+
+History of the numbers that change over time: every player's trophies
+and experience level, and every clan's score.
+
+``clash_cache.db`` only remembers the last minute. Every time a player,
+a clan (its members too) or a leaderboard is fetched, ``Data_Searcher``
+hands the result to ``snapshot_store.record_later(choice, result)``,
+which appends a snapshot to that tag's series from a writer thread,
+and trend charts read them back with ``snapshot_store.query(...)`` and
+``downsample(...)``.
+
+On disk every tag is a directory of column files, one per field plus
+one for the time, each an append-only array of little-endian int32:
+
+    snapshots/players/<TAG>/time.i4  trophies.i4  exp_level.i4
+    snapshots/clans/<TAG>/time.i4    clan_score.i4
+
+The first entry of a column is the actual value (times are seconds
+since ``EPOCH``) and every entry after it is the change since the one
+before, so a snapshot costs 4 bytes per column. A snapshot is only
+written when something changed, or once every `heartbeat` seconds when
+nothing did. Reading maps the files into memory and turns the deltas
+back into values with one ``cumsum``, so months of history for a tag
+load in about a millisecond.
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only safe within one process
+    fcntl = None
+
+from Data_Models import Clan, ClanMember, Player, normalise_tag
+
+log = logging.getLogger(__name__)
+
+# Fields kept for each kind of tag
+SERIES = {
+    "players": ("trophies", "exp_level"),
+    "clans": ("clan_score",),
+}
+
+# Times are stored as seconds since this (2020-01-01 UTC), so they fit
+# in an int32 until 2088
+EPOCH = 1_577_836_800
+
+COLUMN_DTYPE = np.dtype("<i4")
+_PACK = struct.Struct("<i")
+
+# How downsample() can combine the points in one bucket
+AGGREGATES = ("last", "mean", "min", "max")
+
+
+def downsample(
+    times: np.ndarray,
+    values: np.ndarray,
+    step: Optional[int] = None,
+    max_points: Optional[int] = None,
+    agg: str = "last",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Combine the points of a series into buckets of `step` seconds.
+
+    Parameters
+    ----------
+    times, values : numpy.ndarray
+        A series from ``SnapshotStore.query()`` (times sorted).
+    step : int, optional
+        Bucket width in seconds; buckets start at multiples of it.
+    max_points : int, optional
+        Used when `step` isn't given: the narrowest step that leaves at
+        most this many buckets.
+    agg : str
+        ``"last"``, ``"mean"``, ``"min"`` or ``"max"`` of each bucket.
+
+    Returns
+    -------
+    (times, values)
+        The start of each bucket that has points, and its value.
+    """
+    if agg not in AGGREGATES:
+        raise ValueError("agg must be one of: " + ", ".join(AGGREGATES))
+    if len(times) == 0:
+        return times, values
+    if step is None:
+        if not max_points or len(times) <= max_points:
+            return times, values
+        # Buckets are aligned to multiples of the step, so the span can
+        # touch one more bucket than it strictly needs
+        span = int(times[-1] - times[0]) + 1
+        step = max(1, math.ceil(span / max(1, max_points - 1)))
+    step = max(1, int(step))
+
+    buckets = times // step
+    starts = np.flatnonzero(np.diff(buckets, prepend=buckets[0] - 1))
+    if agg == "last":
+        combined = values[np.append(starts[1:], len(values)) - 1]
+    elif agg == "mean":
+        counts = np.diff(np.append(starts, len(values)))
+        combined = np.add.reduceat(values, starts) / counts
+    elif agg == "min":
+        combined = np.minimum.reduceat(values, starts)
+    else:
+        combined = np.maximum.reduceat(values, starts)
+    return buckets[starts] * step, combined
+
+
+class SnapshotStore:
+    """
+    Append-only, delta-encoded column files, one directory per tag.
+
+    Parameters
+    ----------
+    root : str
+        Directory the series are kept in; created when first written to.
+    heartbeat : float
+        Seconds after which an unchanged snapshot is written anyway, so
+        charts show the value was still current then.
+    """
+
+    def __init__(self, root: str = "snapshots", heartbeat: float = 3600):
+        self.root = root
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        # (kind, tag) -> (rows on disk, the last of them decoded) when we
+        # last looked; other processes may have appended since
+        self._last: Dict[Tuple[str, str], Tuple[int, Optional[List[int]]]] = {}
+        # Started on first record_later() (and again in a forked worker)
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._writer_pid: Optional[int] = None
+
+    def _dir(self, kind: str, tag: str) -> str:
+        if kind not in SERIES:
+            raise ValueError("kind must be one of: " + ", ".join(SERIES))
+        tag = normalise_tag(tag)
+        if not tag[1:].isalnum():
+            raise ValueError("Invalid tag: " + tag)
+        return os.path.join(self.root, kind, tag[1:])
+
+    @staticmethod
+    def _columns(kind: str) -> Tuple[str, ...]:
+        return ("time",) + SERIES[kind]
+
+    def _map(self, kind: str, tag: str) -> Optional[Dict[str, np.ndarray]]:
+        """The raw (still delta-encoded) columns, memory-mapped; None if empty."""
+        directory = self._dir(kind, tag)
+        paths = {c: os.path.join(directory, c + ".i4") for c in self._columns(kind)}
+        try:
+            sizes = {c: os.path.getsize(p) for c, p in paths.items()}
+        except OSError:
+            return None
+        # A crash between two column writes leaves one column longer
+        rows = min(sizes.values()) // COLUMN_DTYPE.itemsize
+        if rows == 0:
+            return None
+        return {
+            c: np.memmap(p, dtype=COLUMN_DTYPE, mode="r", shape=(rows,))
+            for c, p in paths.items()
+        }
+
+    def _catch_up(
+        self, kind: str, tag: str, files: List[BinaryIO]
+    ) -> Tuple[int, Optional[List[int]]]:
+        """
+        Rows on disk and the last of them, decoded, for `tag`'s open (and
+        locked) column `files`; only what other processes appended since
+        we last looked is read.
+        """
+        sizes = [os.fstat(f.fileno()).st_size for f in files]
+        rows = min(sizes) // COLUMN_DTYPE.itemsize
+        for f, size in zip(files, sizes):
+            # Drop the half-written tail a crash may have left, so every
+            # column lines up again before we append
+            if size != rows * COLUMN_DTYPE.itemsize:
+                f.truncate(rows * COLUMN_DTYPE.itemsize)
+
+        known, last = self._last.get((kind, tag), (0, None))
+        if last is None or known > rows:
+            known, last = 0, [0] * len(files)
+        if known < rows:
+            last = [
+                value
+                + int(
+                    np.fromfile(
+                        f.name,
+                        dtype=COLUMN_DTYPE,
+                        count=rows - known,
+                        offset=known * COLUMN_DTYPE.itemsize,
+                    ).sum(dtype=np.int64)
+                )
+                for value, f in zip(last, files)
+            ]
+        if rows == 0:
+            last = None
+        self._last[(kind, tag)] = (rows, last)
+        return rows, last
+
+    def _next_row(
+        self,
+        kind: str,
+        values: Dict[str, Optional[int]],
+        last: Optional[List[int]],
+        seconds: int,
+    ) -> Optional[List[int]]:
+        """The snapshot to write after `last`; None if there's nothing to write."""
+        row = [seconds]
+        for i, field in enumerate(SERIES[kind], 1):
+            value = values.get(field)
+            if value is None:
+                if last is None:
+                    return None
+                value = last[i]
+            row.append(int(value))
+        if last is not None:
+            if seconds <= last[0]:
+                return None
+            if row[1:] == last[1:] and seconds - last[0] < self.heartbeat:
+                return None
+        return row
+
+    def append(
+        self,
+        kind: str,
+        tag: str,
+        values: Dict[str, Optional[int]],
+        at: Optional[float] = None,
+    ) -> bool:
+        """
+        Add a snapshot of `tag` (`values` holds the fields of its kind).
+
+        A missing field keeps its last value. Returns False when nothing
+        was written: nothing changed since the last snapshot (and the
+        heartbeat isn't due), it isn't newer than the last one, or a field
+        has never had a value.
+
+        Several processes (e.g. gunicorn workers) can append to the same
+        tag: every write holds an exclusive ``flock`` on the tag's time
+        column and works its deltas out from what's on disk, not from what
+        this process wrote last.
+        """
+        tag = normalise_tag(tag)
+        seconds = int(time.time() if at is None else at) - EPOCH
+        directory = self._dir(kind, tag)
+        paths = [os.path.join(directory, c + ".i4") for c in self._columns(kind)]
+        with self._lock:
+            # Nothing to write, and nobody else appended since our last
+            # look (the time column is always written first): skip opening
+            # and locking the files
+            known, last = self._last.get((kind, tag), (0, None))
+            if last is not None and self._next_row(kind, values, last, seconds) is None:
+                try:
+                    if os.path.getsize(paths[0]) == known * COLUMN_DTYPE.itemsize:
+                        return False
+                except OSError:
+                    pass
+
+            os.makedirs(directory, exist_ok=True)
+            files = [open(path, "ab") for path in paths]
+            try:
+                if fcntl is not None:
+                    fcntl.flock(files[0].fileno(), fcntl.LOCK_EX)
+                rows, last = self._catch_up(kind, tag, files)
+                row = self._next_row(kind, values, last, seconds)
+                if row is None:
+                    return False
+                deltas = row if last is None else [n - o for n, o in zip(row, last)]
+                for f, delta in zip(files, deltas):
+                    f.write(_PACK.pack(delta))
+                    f.flush()
+                self._last[(kind, tag)] = (rows + 1, row)
+            finally:
+                # The time column holds the lock, so it's closed last
+                for f in reversed(files):
+                    f.close()
+        return True
+
+    def record(self, choice: int, result: Any, at: Optional[float] = None) -> int:
+        """
+        Snapshot whatever a successful lookup returned: a player (choice
+        1), a clan and its members (3), or a leaderboard (5 / 6). Other
+        choices are ignored. Returns how many snapshots were written.
+
+        A failure to write is logged, never raised: history is a bonus,
+        the lookup itself already worked.
+        """
+        if choice == 1:
+            entries: List[Any] = [result]
+        elif choice == 3:
+            entries = [result] + list(result.member_list or ())
+        elif choice in (5, 6):
+            entries = list(result)
+        else:
+            return 0
+
+        written = 0
+        for entry in entries:
+            if isinstance(entry, (Player, ClanMember)):
+                kind = "players"
+                values = {"trophies": entry.trophies, "exp_level": entry.exp_level}
+            elif isinstance(entry, Clan):
+                kind, values = "clans", {"clan_score": entry.clan_score}
+            else:
+                continue
+            try:
+                written += self.append(kind, entry.tag or "", values, at)
+            except ValueError:
+                continue  # A tag we can't use as a directory name
+            except OSError:
+                log.exception("Saving snapshots for choice %s failed", choice)
+                break
+        return written
+
+    def record_later(self, choice: int, result: Any) -> "Future[int]":
+        """
+        ``record()`` on the store's writer thread, so an event loop never
+        waits for the disk; snapshots are timed now, not when written.
+        """
+        with self._lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                # One thread keeps every tag's snapshots in order
+                self._writer = ThreadPoolExecutor(1, "snapshot-writer")
+                self._writer_pid = os.getpid()
+            writer = self._writer
+        return writer.submit(self.record, choice, result, time.time())
+
+    def query(
+        self,
+        kind: str,
+        tag: str,
+        field: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        `tag`'s `field` between `start` and `end` (Unix times, inclusive).
+
+        Returns ``(times, values)`` as int64 arrays, times in Unix
+        seconds; both are empty when there's no history.
+        """
+        if field not in SERIES.get(kind, ()):
+            raise ValueError(
+                f"{kind} have no {field!r}; try: " + ", ".join(SERIES.get(kind, ()))
+            )
+        columns = self._map(kind, tag)
+        if columns is None:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+
+        times = np.cumsum(columns["time"], dtype=np.int64) + EPOCH
+        first = 0 if start is None else np.searchsorted(times, start, "left")
+        last = len(times) if end is None else np.searchsorted(times, end, "right")
+        # Values depend on every delta before them, so sum from the start
+        values = np.cumsum(columns[field][:last], dtype=np.int64)
+        return times[first:last], values[first:]
+
+    def tags(self, kind: str) -> List[str]:
+        """Every tag of `kind` with history."""
+        try:
+            names = os.listdir(os.path.join(self.root, kind))
+        except OSError:
+            return []
+        return sorted("#" + name for name in names)
+
+
+snapshot_store = SnapshotStore(
+    os.getenv("CR_SNAPSHOT_DIR", "snapshots"),
+    heartbeat=float(os.getenv("CR_SNAPSHOT_HEARTBEAT", "3600")),
+)
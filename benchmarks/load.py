@@ -0,0 +1,255 @@
+"""
+benchmarks.load
+~~~~~~~~~~~~~~~
+
+Load generator for the Flask app, run against ``benchmarks.mock_api``.
+
+    python -m benchmarks.load --duration 10 --concurrency 8 --latency 0.05
+
+It starts the stand-in API, points the app at it (``CR_API_URL``, with
+the SQLite cache, battle history, card catalog and snapshots in a
+temporary directory so nothing in the repo is touched), serves
+``main.app`` on a local port and then keeps ``--concurrency`` clients
+busy for ``--duration`` seconds, each request picking a route and one
+of ``--tags`` player tags at random. At the end it prints, per route
+and in total:
+
+    requests, requests/sec, p50 / p95 / p99 latency (ms), errors
+
+Use ``--routes`` to benchmark only some routes, ``--ratelimit-every`` to
+make the stand-in answer 429 now and then, ``--keys`` to spread the
+requests over a pool of API keys, and ``--json`` for output a
+script can compare between runs. The app's own rate limiter is set to
+``--rate-limit`` requests/s (per key; high by default), since the
+stand-in has no real quota to protect.
+
+The stand-in runs in the same process as the app, so the absolute
+numbers are lower than a real deployment's; compare runs with each
+other to spot regressions.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List
+from urllib.parse import quote, urlencode
+
+from benchmarks.mock_api import MockApi, make_tag, start_in_thread
+
+# route name -> path for a given player tag (clan routes use the tag too)
+ROUTES: Dict[str, Callable[[str], str]] = {
+    "player": lambda tag: "/player?"
+    + urlencode(
+        {
+            "tag": tag,
+            "fetch_trophies": 1,
+            "fetch_cards": 1,
+            "fetch_current_deck": 1,
+            "fetch_badges": 1,
+        }
+    ),
+    "battles": lambda tag: "/player?" + urlencode({"tag": tag, "fetch_battle_data": 1}),
+    "clan": lambda tag: "/clan?"
+    + urlencode({"clan_tag": tag, "fetch_clan_name": 1, "fetch_clan_member_data": 1}),
+    "game": lambda tag: "/game?fetch_all_cards=1&fetch_top_players=1",
+    "api_player": lambda tag: "/api/player/" + quote(tag.lstrip("#")),
+    "api_battles": lambda tag: "/api/player/"
+    + quote(tag.lstrip("#"))
+    + "/battles?limit=25",
+    "api_leaderboard": lambda tag: "/api/leaderboard/players",
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(
+        len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1)
+    )
+    return sorted_values[index]
+
+
+def app_environment(
+    tmp_dir: str, api_url: str, rate_limit: float, keys: List[str]
+) -> Dict[str, str]:
+    """The environment that points the app at the stand-in API and `tmp_dir`."""
+    return dict(
+        CR_API_KEY=keys[0],
+        CR_API_KEYS=",".join(keys),
+        CR_API_URL=api_url,
+        CR_CACHE_DB=os.path.join(tmp_dir, "clash_cache.db"),
+        CR_BATTLE_DB=os.path.join(tmp_dir, "battles.db"),
+        CR_CARD_CATALOG=os.path.join(tmp_dir, "card_catalog.json"),
+        CR_SNAPSHOT_DIR=os.path.join(tmp_dir, "snapshots"),
+        CR_RATE_LIMIT=str(rate_limit),
+        CR_RATE_BURST=str(max(1, int(rate_limit))),
+    )
+
+
+def serve_app(
+    tmp_dir: str, api_url: str, rate_limit: float, keys: List[str]
+) -> int:
+    """Import the app against the stand-in API and serve it; returns the port."""
+    os.environ.update(app_environment(tmp_dir, api_url, rate_limit, keys))
+    # One log line per request would cost more than some of the routes
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    from werkzeug.serving import make_server
+
+    import main as app_module
+
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(
+        target=server.serve_forever, name="benchmark-app", daemon=True
+    ).start()
+    return server.server_port
+
+
+def run_load(
+    port: int,
+    routes: List[str],
+    tags: List[str],
+    duration: float,
+    concurrency: int,
+) -> Dict[str, Dict[str, list]]:
+    """Hit the app until `duration` is up; returns latencies and errors per route."""
+    results = {name: {"latencies": [], "errors": []} for name in routes}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client() -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        rng = random.Random()
+        while time.perf_counter() < deadline:
+            name = rng.choice(routes)
+            path = ROUTES[name](rng.choice(tags))
+            start = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException) as exc:
+                status = type(exc).__name__
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            elapsed = time.perf_counter() - start
+            with lock:
+                results[name]["latencies"].append(elapsed)
+                if status not in (200, 304):
+                    results[name]["errors"].append(status)
+        connection.close()
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def summarise(results: Dict[str, Dict[str, list]], duration: float) -> Dict[str, dict]:
+    """requests, rps, p50/p95/p99 (ms) and errors, per route and in total."""
+
+    def row(latencies: List[float], errors: list) -> dict:
+        latencies = sorted(latencies)
+        return {
+            "requests": len(latencies),
+            "rps": round(len(latencies) / duration, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "errors": len(errors),
+        }
+
+    summary = {name: row(r["latencies"], r["errors"]) for name, r in results.items()}
+    summary["total"] = row(
+        [t for r in results.values() for t in r["latencies"]],
+        [e for r in results.values() for e in r["errors"]],
+    )
+    return summary
+
+
+def print_table(summary: Dict[str, dict]) -> None:
+    columns = ("requests", "rps", "p50_ms", "p95_ms", "p99_ms", "errors")
+    print(f"{'route':<16}" + "".join(f"{c:>10}" for c in columns))
+    for name, row in summary.items():
+        print(f"{name:<16}" + "".join(f"{row[c]:>10}" for c in columns))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Flask routes against a local stand-in API."
+    )
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tags", type=int, default=100, help="distinct player tags")
+    parser.add_argument(
+        "--routes",
+        default=",".join(ROUTES),
+        help="comma separated, any of: " + ", ".join(ROUTES),
+    )
+    parser.add_argument("--latency", type=float, default=0.02, help="API latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.01)
+    parser.add_argument("--ratelimit-every", type=int, default=0)
+    parser.add_argument(
+        "--rate-limit",
+        type=float,
+        default=1000.0,
+        help="the app's own requests/s limit (CR_RATE_LIMIT)",
+    )
+    parser.add_argument(
+        "--keys", type=int, default=1, help="API keys to rotate (CR_API_KEYS)"
+    )
+    parser.add_argument(
+        "--warmup", type=float, default=1.0, help="seconds, not counted"
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON instead")
+    args = parser.parse_args(argv)
+
+    routes = [r.strip() for r in args.routes.split(",") if r.strip()]
+    unknown = [r for r in routes if r not in ROUTES]
+    if unknown:
+        parser.error("unknown routes: " + ", ".join(unknown))
+
+    keys = [f"benchmark-{i}" for i in range(max(1, args.keys))]
+    api = MockApi(args.latency, args.jitter, args.ratelimit_every, valid_keys=keys)
+    tags = [make_tag(i, "P") for i in range(max(1, args.tags))]
+
+    with tempfile.TemporaryDirectory(prefix="cr-bench-") as tmp_dir:
+        port = serve_app(tmp_dir, start_in_thread(api), args.rate_limit, keys)
+        if args.warmup > 0:
+            run_load(port, routes, tags, args.warmup, args.concurrency)
+        api.stats.update(requests=0, ratelimited=0, not_found=0, keys={})
+
+        results = run_load(port, routes, tags, args.duration, args.concurrency)
+        summary = summarise(results, args.duration)
+
+        from Data_Searcher import background_loop
+
+        background_loop.stop()
+
+    if args.json:
+        json.dump({"routes": summary, "upstream": api.stats}, sys.stdout, indent=2)
+        print()
+    else:
+        print_table(summary)
+        print(
+            f"\nstand-in API: {api.stats['requests']} requests, "
+            f"{api.stats['ratelimited']} answered 429"
+        )
+        if len(keys) > 1:
+            print("per key: " + ", ".join(map(str, api.stats["keys"].values())))
+
+
+if __name__ == "__main__":
+    main()
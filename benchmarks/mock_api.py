@@ -0,0 +1,239 @@
+"""
+benchmarks.mock_api
+~~~~~~~~~~~~~~~~~~~
+
+A local stand-in for the official Clash Royale API, so the app can be
+benchmarked without an API key or a network.
+
+    python -m benchmarks.mock_api --port 8765 --latency 0.05 --ratelimit-every 50
+
+It answers the endpoints ``Data_Searcher`` uses from the JSON in
+``benchmarks/fixtures`` (synthetic data in the API's exact shape), with
+the requested tag filled in:
+
+    /v1/players/{tag}                      player.json
+    /v1/players/{tag}/battlelog            battlelog.json
+    /v1/clans/{tag}                        clan.json (member tags derived from it)
+    /v1/cards                              cards.json
+    /v1/locations/{id}/rankings/{kind}     rankings.json, 1000 entries, paged
+
+Every answer waits ``latency`` (+ up to ``jitter``) seconds, and every
+``ratelimit_every``-th request gets a 429 with ``Retry-After``, like the
+real API when you're over the limit. Player tags starting with ``#0``
+are answered with 404 (``make_tag()`` never makes those). Given
+``valid_keys``, any other bearer token gets a 403, and ``stats["keys"]``
+counts the requests sent with each token.
+
+Point the app at it with ``CR_API_URL=http://127.0.0.1:8765/v1``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from aiohttp import web
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# How many entries every leaderboard has
+RANKING_SIZE = 1000
+
+# Characters the game uses in tags
+TAG_ALPHABET = "0289PYLQGRJCUV"
+
+
+def make_tag(number: int, prefix: str = "P") -> str:
+    """A valid-looking tag for `number` (the same number, the same tag)."""
+    digits = ""
+    # Spread the numbers out so tags look random and are 8+ characters
+    number = len(TAG_ALPHABET) ** 7 + number * 104729
+    while number:
+        digits += TAG_ALPHABET[number % len(TAG_ALPHABET)]
+        number //= len(TAG_ALPHABET)
+    return "#" + prefix + digits
+
+
+def _load(name: str) -> Any:
+    with open(os.path.join(FIXTURES, name + ".json"), "r", encoding="utf8") as f:
+        return json.load(f)
+
+
+class MockApi:
+    """
+    The stand-in API.
+
+    Parameters
+    ----------
+    latency : float
+        Seconds every answer waits before it's sent.
+    jitter : float
+        Up to this many extra seconds, picked at random per request.
+    ratelimit_every : int
+        Answer every n-th request with 429 (0 never does).
+    retry_after : int
+        Seconds put in the ``Retry-After`` header of those 429s.
+    valid_keys : iterable of str, optional
+        The only tokens accepted; None accepts any.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        ratelimit_every: int = 0,
+        retry_after: int = 1,
+        valid_keys: Optional[Iterable[str]] = None,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.ratelimit_every = ratelimit_every
+        self.retry_after = retry_after
+        self.valid_keys = None if valid_keys is None else set(valid_keys)
+        self.stats = {"requests": 0, "ratelimited": 0, "not_found": 0, "keys": {}}
+
+        self._player = _load("player")
+        self._battlelog = _load("battlelog")
+        self._clan = _load("clan")
+        self._cards = _load("cards")
+        self._rankings = _load("rankings")
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_get("/v1/players/{tag}", self.player)
+        app.router.add_get("/v1/players/{tag}/battlelog", self.battlelog)
+        app.router.add_get("/v1/clans/{tag}", self.clan)
+        app.router.add_get("/v1/cards", self.cards)
+        app.router.add_get("/v1/locations/{location}/rankings/{kind}", self.rankings)
+        return app
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        self.stats["requests"] += 1
+        token = request.headers.get("Authorization", "").partition(" ")[2]
+        self.stats["keys"][token] = self.stats["keys"].get(token, 0) + 1
+        if self.valid_keys is not None and token not in self.valid_keys:
+            return web.json_response(
+                {"reason": "accessDenied", "message": "Invalid authorization."},
+                status=403,
+            )
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.ratelimit_every and self.stats["requests"] % self.ratelimit_every == 0:
+            self.stats["ratelimited"] += 1
+            return web.json_response(
+                {"reason": "requestThrottled", "message": "Request was throttled."},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        return await handler(request)
+
+    def _not_found(self) -> web.Response:
+        self.stats["not_found"] += 1
+        return web.json_response({"reason": "notFound"}, status=404)
+
+    @staticmethod
+    def _tag(request: web.Request) -> str:
+        return "#" + request.match_info["tag"].lstrip("#").upper()
+
+    async def player(self, request: web.Request) -> web.Response:
+        tag = self._tag(request)
+        if tag.startswith("#0"):
+            return self._not_found()
+        data = dict(self._player, tag=tag, name="Player " + tag)
+        return web.json_response(data)
+
+    async def battlelog(self, request: web.Request) -> web.Response:
+        tag = self._tag(request)
+        if tag.startswith("#0"):
+            return self._not_found()
+        battles = copy.deepcopy(self._battlelog)
+        for battle in battles:
+            for player in battle["team"]:
+                player["tag"] = tag
+            for player in battle["opponent"]:
+                player["tag"] = player["tag"] + tag[1:4]
+        return web.json_response(battles)
+
+    async def clan(self, request: web.Request) -> web.Response:
+        tag = self._tag(request)
+        seed = sum(map(ord, tag)) * 100
+        members = [
+            dict(member, tag=make_tag(seed + i, "Q"))
+            for i, member in enumerate(self._clan["memberList"])
+        ]
+        return web.json_response(dict(self._clan, tag=tag, memberList=members))
+
+    async def cards(self, request: web.Request) -> web.Response:
+        return web.json_response(self._cards)
+
+    async def rankings(self, request: web.Request) -> web.Response:
+        kind = request.match_info["kind"]
+        if kind not in self._rankings:
+            return self._not_found()
+        limit = int(request.query.get("limit") or RANKING_SIZE)
+        start = int(request.query.get("after") or 0)
+        end = min(start + limit, RANKING_SIZE)
+        template = self._rankings[kind]
+        items = [
+            dict(
+                template,
+                tag=make_tag(rank, "P" if kind == "players" else "C"),
+                rank=rank + 1,
+                previousRank=rank + 2,
+            )
+            for rank in range(start, end)
+        ]
+        cursors: Dict[str, str] = {"after": str(end)} if end < RANKING_SIZE else {}
+        return web.json_response({"items": items, "paging": {"cursors": cursors}})
+
+
+def start_in_thread(api: MockApi, host: str = "127.0.0.1", port: int = 0) -> str:
+    """
+    Serve `api` from a background thread (its own event loop).
+
+    Returns the base URL to put in ``CR_API_URL``; port 0 picks a free one.
+    """
+    ready = threading.Event()
+    url: Dict[str, Optional[str]] = {"value": None}
+
+    def serve() -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(api.app(), access_log=None)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, host, port)
+        loop.run_until_complete(site.start())
+        bound_port = site._server.sockets[0].getsockname()[1]
+        url["value"] = f"http://{host}:{bound_port}/v1"
+        ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=serve, name="mock-clash-api", daemon=True).start()
+    ready.wait()
+    return url["value"]
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--ratelimit-every", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    api = MockApi(args.latency, args.jitter, args.ratelimit_every)
+    print(f"CR_API_URL=http://{args.host}:{args.port}/v1")
+    web.run_app(api.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
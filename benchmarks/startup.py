@@ -0,0 +1,171 @@
+"""
+benchmarks.startup
+~~~~~~~~~~~~~~~~~~
+
+How long a fresh worker takes before it can answer, measured in new
+Python processes so nothing is already imported or cached.
+
+    python -m benchmarks.startup --runs 10
+
+Every run starts ``python`` in the repo root, pointed at
+``benchmarks.mock_api`` like ``benchmarks.load`` does, and times:
+
+    import_ms       importing ``main`` (what a worker does on boot)
+    first_page_ms   the first ``GET /`` (a page that needs no API call)
+    first_api_ms    the first ``GET /api/cards`` (loads the API client)
+    rss_mb          the process' peak memory after both requests
+
+and notes which of the heavy modules (aiohttp, clashroyale, numpy,
+requests) importing ``main`` loaded on its own. It prints the median
+and max of each over ``--runs`` runs; ``--eager`` sets
+``CR_EAGER_IMPORTS`` to compare with importing everything up front,
+``--importtime`` lists the slowest imports of one run (from
+``python -X importtime``) and ``--json`` prints output a script can
+compare between runs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+from benchmarks.load import app_environment
+from benchmarks.mock_api import MockApi, start_in_thread
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("aiohttp", "clashroyale", "numpy", "requests")
+
+METRICS = ("import_ms", "first_page_ms", "first_api_ms", "rss_mb")
+
+# Run in each fresh process; prints one JSON line
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+loaded = [m for m in %r if m in sys.modules]
+client = main.app.test_client()
+page = client.get("/")
+paged = time.perf_counter()
+api = client.get("/api/cards")
+done = time.perf_counter()
+main.stop_background_loop()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "first_page_ms": (paged - imported) * 1000,
+    "first_api_ms": (done - paged) * 1000,
+    "rss_mb": rss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "status": [page.status_code, api.status_code],
+    "loaded": loaded,
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once(env: Dict[str, str]) -> dict:
+    """Start one fresh process and return what the probe measured."""
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(env: Dict[str, str], count: int) -> List[Tuple[str, float]]:
+    """The `count` imports with the largest cumulative time (ms) for ``main``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    times = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        times.append((parts[2].strip(), int(parts[1]) / 1000))
+    return sorted(times, key=lambda item: item[1], reverse=True)[:count]
+
+
+def summarise(runs: List[dict]) -> Dict[str, dict]:
+    return {
+        metric: {
+            "median": round(statistics.median(run[metric] for run in runs), 1),
+            "max": round(max(run[metric] for run in runs), 1),
+        }
+        for metric in METRICS
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Measure how long a fresh worker takes to import and answer."
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--eager", action="store_true", help="import everything up front"
+    )
+    parser.add_argument(
+        "--importtime",
+        type=int,
+        default=0,
+        metavar="N",
+        help="also list the N slowest imports",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON instead")
+    args = parser.parse_args(argv)
+
+    api = MockApi()
+    api_url = start_in_thread(api)
+
+    with tempfile.TemporaryDirectory(prefix="cr-startup-") as tmp_dir:
+        env = dict(os.environ, **app_environment(tmp_dir, api_url, 1000.0, ["bench"]))
+        env["CR_TEMPLATE_CACHE"] = os.path.join(tmp_dir, "templates")
+        env.pop("CR_EAGER_IMPORTS", None)
+        if args.eager:
+            env["CR_EAGER_IMPORTS"] = "1"
+
+        runs = [run_once(env) for _ in range(max(1, args.runs))]
+        imports = slowest_imports(env, args.importtime) if args.importtime else []
+
+    summary = summarise(runs)
+    loaded = sorted({name for run in runs for name in run["loaded"]})
+    statuses = sorted({tuple(run["status"]) for run in runs})
+
+    if args.json:
+        output = {"metrics": summary, "loaded_on_import": loaded}
+        if imports:
+            output["slowest_imports_ms"] = dict(imports)
+        json.dump(output, sys.stdout, indent=2)
+        print()
+        return
+
+    print(f"{'metric':<16}{'median':>10}{'max':>10}")
+    for metric, row in summary.items():
+        print(f"{metric:<16}{row['median']:>10}{row['max']:>10}")
+    print("\nloaded by importing main: " + (", ".join(loaded) or "none of them"))
+    if statuses != [(200, 200)]:
+        print("status codes (/, /api/cards): " + ", ".join(map(str, statuses)))
+    if imports:
+        print("\nslowest imports (cumulative ms):")
+        for name, ms in imports:
+            print(f"  {ms:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,32 @@
 # 1. Importing the external code we need
-import asyncio
+import atexit
+import json
 import os
-
-from flask import Flask, render_template, request
-from Data_Searcher import initialize
+import time
+
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    render_template,
+    request,
+    stream_with_context,
+)
+from jinja2 import FileSystemBytecodeCache
+import Metrics
+from Battle_Store import battle_store
+from Card_Catalog import card_catalog
+from Data_Models import PLAYER_SECTIONS, normalise_tag, to_json
+from Lazy_Imports import is_loaded, lazy_module
+
+# The API client stack (and numpy) is only imported when a page first
+# needs it, so a new worker starts quickly and /home never waits for it
+Data_Searcher = lazy_module("Data_Searcher")
+Deck_Analytics = lazy_module("Deck_Analytics")
+Page_Cache = lazy_module("Page_Cache")
+Replay_Archive = lazy_module("Replay_Archive")
+Snapshot_Store = lazy_module("Snapshot_Store")
 
 
 # 2. Basically what happens to find the api key, ignore this if you
@@ -14,7 +37,8 @@ def get_api_key_or_500():
 
     Returns:
         (api_key, error_response)
-        - api_key: the string key, or None if missing
+        - api_key: the string key, the pool of keys when CR_API_KEYS
+          lists more than one, or None if missing
         - error_response: a (message, status_code) tuple suitable for
           returning from a Flask view, or None if everything is OK.
     """
@@ -26,6 +50,11 @@ def get_api_key_or_500():
        #api_key = f.read().strip()
     
     api_key = os.getenv("CR_API_KEY")
+    if not api_key and Replay_Archive.recorder.replaying:
+        api_key = "replay"  # Replaying never talks to the API
+    key_pool = Data_Searcher.key_pool
+    if len(key_pool) > 1:
+        return key_pool, None  # Several keys: requests take turns on them
     if not api_key:
         return None, (
             "Server configuration error: CR_API_KEY is not set.",
@@ -39,6 +68,64 @@ def get_api_key_or_500():
 app = Flask(__name__)
 
 
+# Every template is compiled once, when the app starts, instead of on the
+# first request that shows it. The compiled code is also kept on disk
+# (in CR_TEMPLATE_CACHE, or a folder in /tmp), so the next worker or
+# restart only loads it
+def precompile_templates():
+    try:
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(
+            os.getenv("CR_TEMPLATE_CACHE") or None
+        )
+    except (OSError, RuntimeError):
+        app.jinja_env.bytecode_cache = None  # No usable folder, compile only
+    for template_name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(template_name)
+        except OSError:
+            # The cache folder isn't writable after all: do without it
+            app.jinja_env.bytecode_cache = None
+            app.jinja_env.get_template(template_name)
+
+
+precompile_templates()
+
+
+# All API lookups run on one background event loop per worker, which is
+# shut down (closing the connection pool) when the process exits
+@atexit.register
+def stop_background_loop():
+    if is_loaded(Data_Searcher):  # Otherwise there's no loop to stop
+        Data_Searcher.background_loop.stop()
+
+
+# Every request is timed and counted, you can see the numbers on
+# /metrics (the counting itself lives in Metrics.py)
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    Metrics.http_in_flight.inc()
+
+
+@app.after_request
+def count_response(response):
+    endpoint = request.endpoint or "unmatched"
+    started = g.pop("request_started", None)
+    Metrics.http_requests.inc(endpoint=endpoint, status=response.status_code)
+
+    # Streamed responses are only finished once the last line is sent,
+    # so the clock stops when the response is closed, not here
+    def stop_request_timer():
+        if started is not None:
+            Metrics.http_in_flight.dec()
+            Metrics.http_request_seconds.observe(
+                time.perf_counter() - started, endpoint=endpoint
+            )
+
+    response.call_on_close(stop_request_timer)
+    return response
+
+
 # 6. Every @app.route() is a different section of webpage ( / = start)
 @app.route("/")
 @app.route("/home")
@@ -47,6 +134,10 @@ def main_page():
     return render_template("Main_page.html")
 
 
+# How many stored battles to show when no limit was given
+BATTLE_PAGE_SIZE = 25
+
+
 # 8. This is a section of the website that deals with the player
 #    data lookup, try read through the code if you understand any
 @app.route("/player", methods=["GET", "POST"])
@@ -57,15 +148,20 @@ def player_data():
     - Only calls the API for the data the user actually requested.
     - Allows partial success: e.g. battles work even if player profile fails.
     - Gives a clearer message when league statistics are missing.
+    - Works as a GET with the choices in the address, which browsers can
+      revalidate (ETag / 304) instead of re-downloading the page.
     """
-    if request.method == "GET":
+    # The lookup can come from the form (POST) or the address bar (GET),
+    # a GET can be bookmarked and answered with 304 Not Modified
+    if request.method == "GET" and "tag" not in request.args:
         return render_template("Player_ds.html")
+    form = request.values
 
     api_key, error_response = get_api_key_or_500()
     if error_response:
         return error_response
 
-    user_tag = request.form["tag"].strip()
+    user_tag = form["tag"].strip()
 
     # What does the user want?
     player_fields_keys = (
@@ -79,12 +175,12 @@ def player_data():
         "fetch_league_statistics",
     )
 
-    want_any_player_field = any(key in request.form for key in player_fields_keys)
-    want_battles = "fetch_battle_data" in request.form
+    want_any_player_field = any(key in form for key in player_fields_keys)
+    want_battles = "fetch_battle_data" in form
 
     # If they didn't tick anything, bail early (no API calls)
     if not (want_any_player_field or want_battles):
-        return render_template(
+        return Page_Cache.render_cached(
             "Player_dp.html",
             tag=user_tag,
             trophies=None,
@@ -105,36 +201,91 @@ def player_data():
     player_error_msg = None
     battle_error_msg = None
 
-    # 9. player info
+    # --------- SAFE BATTLE LIMIT PARSING ----------
+    # Treat empty/invalid input as "no limit" (None)
+    raw_battle_limit = form.get("fetch_battle_limit", "").strip()
+    if raw_battle_limit.isdigit():
+        battle_limit = int(raw_battle_limit)
+    else:
+        battle_limit = None
+
+    # Which page of the stored battle history (1 = newest)
+    raw_battle_page = form.get("fetch_battle_page", "").strip()
+    battle_page = max(1, int(raw_battle_page)) if raw_battle_page.isdigit() else 1
+
+    # Only the parts of the profile that were ticked get converted/kept
+    player_sections = {
+        "fetch_cards": "cards",
+        "fetch_arena_name": "arena",
+        "fetch_arena_id": "arena",
+        "fetch_current_deck": "current_deck",
+        "fetch_badges": "badges",
+        "fetch_league_statistics": "league_statistics",
+    }
+    fields = {
+        section for key, section in player_sections.items() if key in form
+    }
+
+    # 9. player info and battles, fetched at the same time
+    lookups = {}
+    if want_any_player_field:
+        lookups["player"] = {"tag": user_tag, "choice": 1, "fields": fields}
+    if want_battles:
+        lookups["battles"] = {"tag": user_tag, "choice": 2}
+    results = Data_Searcher.run_sync(Data_Searcher.fetch_many(api_key, lookups))
+
+    # 10. Splitting the results from the error messages
     if want_any_player_field:
-        player = asyncio.run(initialize(api_key, user_tag, 1))
+        player = results["player"]
         if isinstance(player, str):
             player_error_msg = player
             player = None  # ensure we don't try to read attributes from a string
 
-    # 10. battles
     if want_battles:
-        battle_data = asyncio.run(initialize(api_key, user_tag, 2))
+        battle_data = results["battles"]
         if isinstance(battle_data, str):
             battle_error_msg = battle_data
+        else:
+            battle_store.ingest(user_tag, battle_data)
+
+        # The page itself comes from the local battle history, which also
+        # remembers battles that have dropped out of the API's last 25
+        page_size = battle_limit or BATTLE_PAGE_SIZE
+        stored = battle_store.page(user_tag, page_size, (battle_page - 1) * page_size)
+        if battle_error_msg and not stored:
             battle_data = None
+        else:
+            battle_data = stored
 
     # 11. Seeing what the user has ticked
     if player is not None:
-        trophies = player.trophies if "fetch_trophies" in request.form else None
-        exp_level = player.exp_level if "fetch_exp_level" in request.form else None
-        cards = player.cards if "fetch_cards" in request.form else None
-        arena_name = player.arena.name if "fetch_arena_name" in request.form else None
-        arena_id = player.arena.id if "fetch_arena_id" in request.form else None
+        trophies = player.trophies if "fetch_trophies" in form else None
+        exp_level = player.exp_level if "fetch_exp_level" in form else None
+        cards = player.cards if "fetch_cards" in form else None
+        arena = player.arena
+        arena_name = (
+            arena.name if arena and "fetch_arena_name" in form else None
+        )
+        arena_id = arena.id if arena and "fetch_arena_id" in form else None
         current_deck = (
-            player.current_deck if "fetch_current_deck" in request.form else None
+            player.current_deck if "fetch_current_deck" in form else None
         )
-        badges = player.badges if "fetch_badges" in request.form else None
+        badges = player.badges if "fetch_badges" in form else None
         league_statistics = (
             player.league_statistics
-            if "fetch_league_statistics" in request.form
+            if "fetch_league_statistics" in form
             else None
         )
+        # Join the cards against the local catalog (one dict lookup each)
+        # and leave the deck cards out of the collection grid here rather
+        # than searching the deck for every card inside the template
+        if current_deck is not None:
+            current_deck = [card_catalog.join(card) for card in current_deck]
+        if cards is not None:
+            deck_ids = {card.id for card in current_deck or ()}
+            cards = [
+                card_catalog.join(card) for card in cards if card.id not in deck_ids
+            ]
     else:
         # Either they didn't ask for player fields, or player lookup failed
         trophies = None
@@ -160,7 +311,7 @@ def player_data():
 
     # If they explicitly asked for league stats and none exist, say that
     if (
-        "fetch_league_statistics" in request.form
+        "fetch_league_statistics" in form
         and league_statistics is None
         and player is not None
     ):
@@ -184,15 +335,7 @@ def player_data():
 
     placeholder = " | ".join(placeholder_parts) if placeholder_parts else ""
 
-    # --------- SAFE BATTLE LIMIT PARSING ----------
-    # Treat empty/invalid input as "no limit" (None)
-    raw_battle_limit = request.form.get("fetch_battle_limit", "").strip()
-    if raw_battle_limit.isdigit():
-        battle_limit = int(raw_battle_limit)
-    else:
-        battle_limit = None
-
-    return render_template( #12. This is all that should be returned
+    return Page_Cache.render_cached(   #12. This is all that should be returned
         "Player_dp.html",   #    at the end
         tag=user_tag,
         trophies=trophies,
@@ -213,22 +356,23 @@ def player_data():
 #     is basically the same as player's
 @app.route("/clan", methods=["GET", "POST"])
 def clan_data():
-    if request.method == "GET":
+    if request.method == "GET" and "clan_tag" not in request.args:
         return render_template("Clan_ds.html")
+    form = request.values
 
     api_key, error_response = get_api_key_or_500()
     if error_response:
         return error_response
 
-    clan_tag = request.form["clan_tag"].strip()
+    clan_tag = form["clan_tag"].strip()
 
     # 3 = clan data (your initialize() design)
-    clan = asyncio.run(initialize(api_key, clan_tag, 3))
+    clan = Data_Searcher.run_sync(Data_Searcher.initialize(api_key, clan_tag, 3))
     clan_error = isinstance(clan, str)
 
     # ---------- CASE 1: clan lookup failed ----------
     if clan_error:
-        return render_template(
+        return Page_Cache.render_cached(
             "Clan_dp.html",
             clan_tag=clan_tag if clan != "No such clan tag." else None,
             clan_name=None,
@@ -238,11 +382,11 @@ def clan_data():
         )
 
     # ---------- CASE 2: clan OK ----------
-    clan_name = clan.name if "fetch_clan_name" in request.form else None
-    clan_score = clan.clan_score if "fetch_clan_score" in request.form else None
+    clan_name = clan.name if "fetch_clan_name" in form else None
+    clan_score = clan.clan_score if "fetch_clan_score" in form else None
 
     # Use the *list* of members if available
-    if "fetch_clan_member_data" in request.form:
+    if "fetch_clan_member_data" in form:
         raw_members = getattr(clan, "member_list", None)
         if isinstance(raw_members, (list, tuple)):
             clan_member_data = raw_members
@@ -256,7 +400,7 @@ def clan_data():
     else:
         placeholder = ""
 
-    return render_template(
+    return Page_Cache.render_cached(
         "Clan_dp.html",
         clan_tag=clan_tag,
         clan_name=clan_name,
@@ -275,21 +419,27 @@ def game_data():
     - Only calls each endpoint if its checkbox was ticked.
     - Allows partial success and shows API "empty items" as messages.
     """
-    if request.method == "GET":
+    if request.method == "GET" and not request.args:
+        # Start keeping cards and leaderboards warm while the user is
+        # still ticking boxes
+        api_key, error_response = get_api_key_or_500()
+        if api_key:
+            Data_Searcher.global_refresher.start(api_key)
         return render_template("Game_ds.html")
+    form = request.values
 
     api_key, error_response = get_api_key_or_500()
     if error_response:
         return error_response
 
     # What did the user actually ask for?
-    want_cards = "fetch_all_cards" in request.form
-    want_players = "fetch_top_players" in request.form
-    want_clans = "fetch_top_clans" in request.form
+    want_cards = "fetch_all_cards" in form
+    want_players = "fetch_top_players" in form
+    want_clans = "fetch_top_clans" in form
 
     # If they didn't tick anything, bail early
     if not (want_cards or want_players or want_clans):
-        return render_template(
+        return Page_Cache.render_cached(
             "Game_dp.html",
             all_cards=None,
             top_players=None,
@@ -307,35 +457,39 @@ def game_data():
 
     error_messages = []
 
-    # 4 = all cards
+    # 6 = top clans, with optional limit
+    raw_clan_limit = form.get("fetch_clan_limit", "").strip()
+    if raw_clan_limit.isdigit():
+        clan_limit = int(raw_clan_limit)
+    else:
+        clan_limit = None
+
+    # 4 = all cards, 5 = top players, 6 = top clans, all fetched at once
+    lookups = {}
+    if want_cards:
+        lookups["cards"] = {"choice": 4}
+    if want_players:
+        lookups["players"] = {"choice": 5}
+    if want_clans:
+        lookups["clans"] = {"choice": 6}
+        if clan_limit is not None:
+            lookups["clans"]["limit"] = clan_limit
+    results = Data_Searcher.run_sync(Data_Searcher.fetch_many(api_key, lookups))
+
     if want_cards:
-        all_cards_data = asyncio.run(initialize(api_key, "", 4))
+        all_cards_data = results["cards"]
         if isinstance(all_cards_data, str):
             all_cards_error = True
             error_messages.append(all_cards_data)
 
-    # 5 = top players
     if want_players:
-        top_players_data = asyncio.run(initialize(api_key, "", 5))
+        top_players_data = results["players"]
         if isinstance(top_players_data, str):
             top_players_error = True
             error_messages.append(top_players_data)
 
-    # 6 = top clans, with optional limit
-    raw_clan_limit = request.form.get("fetch_clan_limit", "").strip()
-    if raw_clan_limit.isdigit():
-        clan_limit = int(raw_clan_limit)
-    else:
-        clan_limit = None
-
     if want_clans:
-        if clan_limit is not None:
-            top_clans_data = asyncio.run(
-                initialize(api_key, "", 6, limit=clan_limit)
-            )
-        else:
-            top_clans_data = asyncio.run(initialize(api_key, "", 6))
-
+        top_clans_data = results["clans"]
         if isinstance(top_clans_data, str):
             top_clans_error = True
             error_messages.append(top_clans_data)
@@ -345,13 +499,28 @@ def game_data():
     top_players = None if (not want_players or top_players_error) else top_players_data
     top_clans = None if (not want_clans or top_clans_error) else top_clans_data
 
+    # Say so when we're showing an older copy because a refresh failed
+    stale_names = {4: "card list", 5: "top players", 6: "top clans"}
+    from_refresher = {
+        4: want_cards,
+        5: want_players,
+        # More clans than the refresher keeps are fetched there and then
+        6: want_clans and (clan_limit or 0) <= Data_Searcher.REFRESH_LIMIT,
+    }
+    for choice, wanted in from_refresher.items():
+        if wanted and Data_Searcher.global_refresher.is_stale(choice):
+            error_messages.append(
+                f"Showing the last saved {stale_names[choice]}, "
+                "the API couldn't be reached to update it."
+            )
+
     placeholder = " | ".join(error_messages) if error_messages else ""
 
     # If there are no errors but everything came back empty, say so
     if not placeholder and not any((all_cards, top_players, top_clans)):
         placeholder = "No data was returned for your selection."
 
-    return render_template(
+    return Page_Cache.render_cached(
         "Game_dp.html",
         all_cards=all_cards,
         top_players=top_players,
@@ -360,7 +529,384 @@ def game_data():
     )
 
 
-# 15. This is just kept on for a while (it's not important), think
+# 15. Deck analytics over every battle we've stored, the maths lives in
+#     Deck_Analytics.py (it uses numpy so it stays fast with lots of data)
+@app.route("/analytics", methods=["GET", "POST"])
+def analytics():
+    """
+    Win rates per card, opponent card, deck and average elixir.
+
+    - With a player tag, their latest battles are fetched (and stored)
+      first, and only their battles are used.
+    - Without one, every battle in the local battle history is used.
+    """
+    if request.method == "GET":
+        return render_template("Analytics_ds.html")
+
+    user_tag = request.form.get("tag", "").strip()
+    raw_min_games = request.form.get("min_games", "").strip()
+    min_games = int(raw_min_games) if raw_min_games.isdigit() else 1
+    card_names = [
+        name.strip()
+        for name in request.form.get("with_cards", "").split(",")
+        if name.strip()
+    ]
+
+    placeholder_parts = []
+
+    api_key, error_response = get_api_key_or_500()
+    if user_tag:
+        if error_response:
+            return error_response
+        battles = Data_Searcher.run_sync(Data_Searcher.initialize(api_key, user_tag, 2))
+        if isinstance(battles, str):
+            placeholder_parts.append(battles)
+        else:
+            battle_store.ingest(user_tag, battles)
+
+    if not len(card_catalog) and api_key:
+        # Card names and elixir costs come from the catalog, which is only
+        # filled once the card list (choice 4) has been fetched
+        cards = Data_Searcher.run_sync(Data_Searcher.initialize(api_key, "", 4))
+        if isinstance(cards, str):
+            placeholder_parts.append(cards)
+
+    # Rebuilt only when battles were added or the catalog changed
+    stats = Deck_Analytics.DeckAnalytics.cached_from_store(player_tag=user_tag or None)
+
+    if card_names:
+        cards = [card_catalog.by_name(name) for name in card_names]
+        unknown = [name for name, card in zip(card_names, cards) if card is None]
+        if unknown:
+            placeholder_parts.append("Unknown cards: " + ", ".join(unknown))
+        stats = stats.with_cards(card.id for card in cards if card is not None)
+
+    summary = stats.summary()
+    if not summary["games"]:
+        placeholder_parts.append("No stored battles match your selection.")
+
+    return render_template(
+        "Analytics_dp.html",
+        tag=user_tag,
+        placeholder=" | ".join(placeholder_parts),
+        summary=summary,
+        card_rates=stats.card_win_rates(min_games, top=30),
+        opponent_rates=stats.opponent_card_win_rates(min_games, top=30),
+        archetype_rates=stats.archetype_win_rates(min_games, top=20),
+        elixir_rates=stats.elixir_win_rates(min_games),
+    )
+
+
+# 16. Looking up lots of players at once, this one answers in JSON
+#     instead of a webpage since it's meant for scripts, not people
+BULK_MAX_TAGS = 1000
+BULK_MAX_CONCURRENCY = 50
+
+
+@app.route("/players/bulk", methods=["POST"])
+def players_bulk():
+    """
+    Bulk player lookup.
+
+    Expects a JSON body like::
+
+        {"tags": ["#ABC", "#DEF"], "concurrency": 10}
+
+    or ``{"clan_tag": "#XYZ"}`` to look up every member of a clan.
+    Every tag gets either a "data" or an "error" entry in the response.
+    """
+    api_key, error_response = get_api_key_or_500()
+    if error_response:
+        return error_response
+
+    tags, concurrency, error_response = read_bulk_request(api_key)
+    if error_response:
+        return error_response
+
+    results = Data_Searcher.run_sync(
+        Data_Searcher.bulk_lookup(api_key, tags, 1, concurrency=concurrency)
+    )
+
+    return jsonify(
+        results=[bulk_entry(tag, result) for tag, result in results.items()]
+    )
+
+
+def read_bulk_request(api_key):
+    """
+    Read the tags and concurrency out of a bulk lookup's JSON body.
+
+    Returns (tags, concurrency, error_response); error_response is None
+    when the body was fine.
+    """
+    body = request.get_json(silent=True) or {}
+    tags = body.get("tags") or []
+    clan_tag = str(body.get("clan_tag", "")).strip()
+
+    if not isinstance(tags, list) or not all(isinstance(t, str) for t in tags):
+        return None, None, (jsonify(error="'tags' must be a list of strings."), 400)
+
+    # Expand a clan into its members' tags
+    if clan_tag:
+        clan, error_response = api_lookup(
+            Data_Searcher.initialize(api_key, clan_tag, 3)
+        )
+        if error_response:
+            return None, None, error_response
+        if isinstance(clan, str):
+            return None, None, api_error(clan)
+        tags = tags + [member.tag for member in (clan.member_list or [])]
+
+    tags = [t.strip() for t in tags if t.strip()]
+    if not tags:
+        return None, None, (jsonify(error="No tags to look up."), 400)
+    if len(tags) > BULK_MAX_TAGS:
+        return None, None, (
+            jsonify(error=f"At most {BULK_MAX_TAGS} tags per request."),
+            400,
+        )
+
+    try:
+        concurrency = int(body.get("concurrency", 10))
+    except (TypeError, ValueError):
+        return None, None, (jsonify(error="'concurrency' must be a number."), 400)
+    return tags, max(1, min(concurrency, BULK_MAX_CONCURRENCY)), None
+
+
+def bulk_entry(tag, result):
+    if isinstance(result, str):
+        return {"tag": tag, "error": result}
+    return {"tag": tag, "data": to_json(result)}
+
+
+# 17. A JSON version of every page, for scripts and apps instead of
+#     people. Long lists are sent as NDJSON (one JSON object per line)
+#     while they're being read, so nobody has to wait for (or hold) the
+#     whole thing
+def api_error(message):
+    """Turn one of Data_Searcher's error strings into a JSON error response."""
+    if message.startswith("No such") or message in (
+        "Not found.",
+        Data_Searcher.NOT_RECORDED_MESSAGE,
+    ):
+        status = 404
+    elif message == Data_Searcher.RATE_LIMIT_MESSAGE:
+        status = 429
+    else:
+        status = 502
+    return jsonify(error=message), status
+
+
+def api_lookup(coro):
+    """run_sync() for the JSON routes: a bad tag is a 400, not a crash."""
+    try:
+        return Data_Searcher.run_sync(coro), None
+    except ValueError as exc:
+        return None, (jsonify(error=str(exc)), 400)
+
+
+def query_int(name, default=None):
+    raw = request.args.get(name, "").strip()
+    return int(raw) if raw.isdigit() else default
+
+
+def ndjson_response(items):
+    """Stream `items` (plain dicts) as NDJSON, one line each as they come."""
+
+    def generate():
+        for item in items:
+            yield json.dumps(item, separators=(",", ":")) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/player/<tag>")
+def api_player(tag):
+    """
+    A player's profile as JSON.
+
+    ``?fields=cards,badges`` only converts and sends those optional
+    sections (see ``Data_Models.PLAYER_SECTIONS``); the default is all.
+    """
+    api_key, error_response = get_api_key_or_500()
+    if error_response:
+        return error_response
+
+    fields = None
+    if "fields" in request.args:
+        fields = {f.strip() for f in request.args["fields"].split(",") if f.strip()}
+        unknown = fields.difference(PLAYER_SECTIONS)
+        if unknown:
+            return jsonify(error="Unknown fields: " + ", ".join(sorted(unknown))), 400
+
+    player, error_response = api_lookup(
+        Data_Searcher.initialize(api_key, tag, 1, fields=fields)
+    )
+    if error_response:
+        return error_response
+    if isinstance(player, str):
+        return api_error(player)
+    return jsonify(to_json(player))
+
+
+@app.route("/api/player/<tag>/battles")
+def api_battles(tag):
+    """
+    A player's stored battle history as NDJSON, newest first.
+
+    The latest battles are fetched (and stored) first unless
+    ``?refresh=0``; ``?limit=`` and ``?offset=`` pick a slice, the
+    default is everything we have.
+    """
+    if request.args.get("refresh", "1") != "0":
+        api_key, error_response = get_api_key_or_500()
+        if error_response:
+            return error_response
+        battles, error_response = api_lookup(Data_Searcher.initialize(api_key, tag, 2))
+        if error_response:
+            return error_response
+        if isinstance(battles, str):
+            if not battle_store.count(tag):
+                return api_error(battles)
+        else:
+            battle_store.ingest(tag, battles)
+
+    stored = battle_store.iter_battles(
+        tag, query_int("limit"), query_int("offset", 0)
+    )
+    return ndjson_response(to_json(battle) for battle in stored)
+
+
+@app.route("/api/clan/<tag>")
+def api_clan(tag):
+    """A clan, with its member list, as JSON."""
+    api_key, error_response = get_api_key_or_500()
+    if error_response:
+        return error_response
+
+    clan, error_response = api_lookup(Data_Searcher.initialize(api_key, tag, 3))
+    if error_response:
+        return error_response
+    if isinstance(clan, str):
+        return api_error(clan)
+    return jsonify(to_json(clan))
+
+
+@app.route("/api/cards")
+def api_cards():
+    """Every card in the game as JSON."""
+    api_key, error_response = get_api_key_or_500()
+    if error_response:
+        return error_response
+
+    cards = Data_Searcher.run_sync(Data_Searcher.initialize(api_key, "", 4))
+    if isinstance(cards, str):
+        return api_error(cards)
+    return jsonify(to_json(cards))
+
+
+@app.route("/api/leaderboard/<kind>")
+def api_leaderboard(kind):
+    """
+    A whole leaderboard (``players`` or ``clans``) as NDJSON.
+
+    ``?location=`` is ``global`` (default) or a location id and ``?max=``
+    stops after that many entries. Pages are fetched while the previous
+    ones are being sent; if a page fails, the last line is
+    ``{"error": ...}``.
+    """
+    choices = {"players": 5, "clans": 6}
+    if kind not in choices:
+        return jsonify(error="Leaderboards are 'players' or 'clans'."), 404
+
+    api_key, error_response = get_api_key_or_500()
+    if error_response:
+        return error_response
+
+    location = request.args.get("location", "global").strip() or "global"
+    if location != "global" and not (location.isascii() and location.isdigit()):
+        return jsonify(error="?location= must be 'global' or a location id."), 400
+
+    entries = Data_Searcher.iter_leaderboard(
+        api_key,
+        choices[kind],
+        location_id=location,
+        max_items=query_int("max"),
+    )
+
+    def lines():
+        try:
+            for entry in Data_Searcher.iterate_sync(entries):
+                yield to_json(entry)
+        except Data_Searcher.API_ERRORS as exc:
+            yield {"error": Data_Searcher.api_error_message(exc)}
+
+    return ndjson_response(lines())
+
+
+@app.route("/api/trends/<kind>/<tag>")
+def api_trends(kind, tag):
+    """
+    The history of a player's (``players``) or clan's (``clans``) numbers.
+
+    ``?field=`` is ``trophies`` (default) or ``exp_level`` for players
+    and ``clan_score`` for clans; ``?from=`` and ``?to=`` are Unix times;
+    ``?points=`` (default 500) or ``?step=`` (seconds) downsample it,
+    combining each step with ``?agg=last|mean|min|max``. Answers with
+    ``{"tag", "field", "points": [[time, value], ...]}``.
+    """
+    if kind not in Snapshot_Store.SERIES:
+        return jsonify(error="Trends are for 'players' or 'clans'."), 404
+    field = request.args.get("field", Snapshot_Store.SERIES[kind][0])
+    try:
+        times, values = Snapshot_Store.snapshot_store.query(
+            kind, tag, field, query_int("from"), query_int("to")
+        )
+        times, values = Snapshot_Store.downsample(
+            times,
+            values,
+            step=query_int("step"),
+            max_points=query_int("points", 500),
+            agg=request.args.get("agg", "last"),
+        )
+    except ValueError as exc:
+        return jsonify(error=str(exc)), 400
+    return jsonify(
+        tag=normalise_tag(tag),
+        field=field,
+        points=[list(point) for point in zip(times.tolist(), values.tolist())],
+    )
+
+
+@app.route("/api/players/bulk", methods=["POST"])
+def api_players_bulk():
+    """
+    ``/players/bulk``, streamed: one NDJSON line per tag as soon as that
+    tag's lookup finishes (so not in the order they were given).
+    """
+    api_key, error_response = get_api_key_or_500()
+    if error_response:
+        return error_response
+
+    tags, concurrency, error_response = read_bulk_request(api_key)
+    if error_response:
+        return error_response
+
+    results = Data_Searcher.iter_bulk_lookup(api_key, tags, 1, concurrency=concurrency)
+    return ndjson_response(
+        bulk_entry(tag, result) for tag, result in Data_Searcher.iterate_sync(results)
+    )
+
+
+# 18. Numbers about how the app is doing (how long lookups take, how
+#     often the caches help, how many errors the API gave us), in the
+#     text format Prometheus reads
+@app.route("/metrics")
+def metrics():
+    return Response(Metrics.render(), content_type=Metrics.CONTENT_TYPE)
+
+
+# 19. This is just kept on for a while (it's not important), think
 #     of it as confirming that the website is a 'test' area, the
 #     debug=True is normally taken away in production
 if __name__ == "__main__":